@@ -0,0 +1,94 @@
+# encoding: utf-8
+"""
+Benchmark fetching the output of a python command from the Tao process.
+
+Compares the old line-by-line transfer (one RPC round trip per scratch line)
+with the bulk transfer used by :meth:`Tao.python`, for lattices of varying
+size.
+
+Usage:
+
+    python benchmarks/bench_python.py [NUM_ELEMENTS ...]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import shutil
+import tempfile
+from timeit import default_timer
+
+from pytao.tao import Tao
+
+
+LATTICE = """
+parameter[particle] = proton
+parameter[geometry] = open
+beginning[e_tot]    = 1e9
+beginning[beta_a]   = 10
+beginning[beta_b]   = 10
+
+d: drift, l = 0.5
+seq: line = ({} * d)
+use, seq
+"""
+
+
+def count_requests(tao):
+    """Wrap the RPC client of `tao` to count round trips."""
+    service = tao._service
+    request = service._request
+    counter = [0]
+    def counting_request(*args):
+        counter[0] += 1
+        return request(*args)
+    service._request = counting_request
+    return counter
+
+
+def fetch_linewise(tao, *command):
+    tao.command('python', '-noprint', *command)
+    return [
+        tao.pipe.scratch_line(n+1).split(';')
+        for n in range(tao.pipe.scratch_n_lines())
+    ]
+
+
+def fetch_bulk(tao, *command):
+    return tao.python(*command)
+
+
+def measure(tao, counter, fetch, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        counter[0] = 0
+        start = default_timer()
+        lines = fetch(tao, 'lat_ele_list', '1@0')
+        best = min(best, default_timer() - start)
+    return len(lines), counter[0], best
+
+
+def main(sizes):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print('{:>8} {:>10} {:>10} {:>12} {:>12}'.format(
+            'lines', 'rpc/old', 'rpc/new', 'time/old', 'time/new'))
+        for size in sizes:
+            filename = os.path.join(tmpdir, 'bench.lat')
+            with open(filename, 'wt') as f:
+                f.write(LATTICE.format(size))
+            tao = Tao('-lat', filename, '-noplot')
+            counter = count_requests(tao)
+            n, rpc_old, t_old = measure(tao, counter, fetch_linewise)
+            n, rpc_new, t_new = measure(tao, counter, fetch_bulk)
+            print('{:>8} {:>10} {:>10} {:>11.2f}ms {:>11.2f}ms'.format(
+                n, rpc_old, rpc_new, t_old*1e3, t_new*1e3))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 5000])
@@ -0,0 +1,53 @@
+# encoding: utf-8
+"""
+Compare the startup time of Tao instances with and without a template.
+
+A cold start spawns a new process and initializes Tao, a warm start forks
+an initialized template process. The time for parsing the lattice is
+simulated by the synthetic tao stand-in:
+
+    python setup.py build_ext --inplace --fake-tao
+    PYTHONPATH=. python benchmarks/bench_startup.py --init-ms 0 500
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+
+from pytao.tao import Tao, TaoTemplate
+
+from run import measure
+
+
+def start_cold(initargs):
+    Tao(*initargs).close()
+
+
+def start_warm(template):
+    template.spawn().close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--init-ms', type=int, nargs='+', default=[0, 500],
+                        help="simulated lattice parsing time in ms")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="number of startups per measurement")
+    opts = parser.parse_args(args)
+
+    print('{:<10} {:>12} {:>12} {:>10}'.format(
+        'init ms', 'cold ms', 'warm ms', 'speedup'))
+    for init_ms in opts.init_ms:
+        initargs = ['-fake_init_ms', init_ms]
+        cold = measure(lambda: start_cold(initargs), opts.repeat)[0]
+        with TaoTemplate(*initargs) as template:
+            warm = measure(lambda: start_warm(template), opts.repeat)[0]
+        print('{:<10} {:>12.2f} {:>12.2f} {:>10.1f}'.format(
+            init_ms, cold*1e3, warm*1e3, cold/warm))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# encoding: utf-8
+"""
+Compare the latency of the RPC transport with the in-process mode.
+
+Runs the benchmarks from `run.py` on a Tao subprocess and on an in-process
+Tao instance with the same workload:
+
+    python setup.py build_ext --inplace --fake-tao
+    PYTHONPATH=. python benchmarks/bench_transport.py --lines 10 1000
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+
+from pytao.tao import Tao
+
+from run import BENCHMARKS, measure
+
+
+# Benchmarks that don't involve communication with tao are not interesting:
+SKIP = ('_parse_dict', '_parse_array', 'CaptureIO')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--lines', type=int, nargs='+', default=[10, 10000],
+                        help="number of output lines produced by tao")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help="number of calls per measurement")
+    opts = parser.parse_args(args)
+
+    rpc = Tao()
+    local = Tao(in_process=True)
+    print('{:<14} {:>8} {:>12} {:>12} {:>8}'.format(
+        'benchmark', 'lines', 'rpc ms', 'local ms', 'ratio'))
+    for lines in opts.lines:
+        for name, bench in BENCHMARKS:
+            if name in SKIP:
+                continue
+            times = []
+            for tao in (rpc, local):
+                tao.command('fake_lines', lines)
+                func, count = bench(tao, lines)
+                times.append(measure(func, opts.repeat)[0])
+            print('{:<14} {:>8} {:>12.4f} {:>12.4f} {:>8.1f}'.format(
+                name, lines, times[0]*1e3, times[1]*1e3, times[0]/times[1]))
+    rpc.close()
+    local.close()
+
+
+if __name__ == '__main__':
+    main()
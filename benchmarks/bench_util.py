@@ -0,0 +1,66 @@
+# encoding: utf-8
+"""
+Compare the scalar and vectorized coordinate transformations in pytao.util.
+
+Converts a synthetic particle distribution between MAD-X and Bmad
+coordinates, once particle by particle and once for the whole array:
+
+    PYTHONPATH=. python benchmarks/bench_util.py --particles 1000000
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+from math import sqrt
+
+import numpy as np
+
+from pytao import util
+
+from run import measure
+
+
+M = 0.938272e9          # proton mass [eV]
+E0 = 7e12               # total energy [eV]
+
+
+def benchmarks(coords):
+    P0 = sqrt(E0**2 - M**2)
+    beta = P0 / E0
+    out = np.empty_like(coords)
+    t, pt = coords[4], coords[5]
+    return [
+        ('t_to_z', lambda: [
+            util.t_to_z(a, b, M, E0) for a, b in zip(t, pt)]),
+        ('t_to_z_array', lambda: util.t_to_z_array(t, pt, M, E0)),
+        ('madx_to_bmad', lambda: util.madx_to_bmad(coords, M, E0, out=out)),
+        ('z_to_t', lambda: [
+            util.z_to_t(a, b, beta, E0, P0) for a, b in zip(t, pt)]),
+        ('z_to_t_array', lambda: util.z_to_t_array(t, pt, beta, E0, P0)),
+        ('bmad_to_madx', lambda: util.bmad_to_madx(
+            coords, beta, E0, P0, out=out)),
+    ]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--particles', type=int, default=1000000,
+                        help="number of particles")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="number of calls per measurement")
+    opts = parser.parse_args(args)
+
+    coords = np.random.normal(scale=1e-3, size=(6, opts.particles))
+    print('{:<14} {:>12} {:>16} {:>12}'.format(
+        'benchmark', 'ms/call', 'particles/s', 'peak KiB'))
+    for name, func in benchmarks(coords):
+        best, peak = measure(func, opts.repeat)
+        print('{:<14} {:>12.2f} {:>16.0f} {:>12.1f}'.format(
+            name, best*1e3, opts.particles/best, peak/1024))
+
+
+if __name__ == '__main__':
+    main()
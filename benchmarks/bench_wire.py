@@ -0,0 +1,72 @@
+# encoding: utf-8
+"""
+Compare the throughput of small calls with the pickle and binary protocols.
+
+Prints calls per second for short commands and python queries with the
+default minrpc protocol and with ``Tao(protocol='binary')``:
+
+    python setup.py build_ext --inplace --fake-tao
+    PYTHONPATH=. python benchmarks/bench_wire.py --lines 1 10 100
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+
+from pytao.tao import Tao
+
+from run import measure
+
+
+def bench_command(tao):
+    return lambda: tao.command('set global lattice_calc_on = F')
+
+def bench_python(tao):
+    return lambda: tao.python('lat_ele_list 1@0')
+
+def bench_properties(tao):
+    return lambda: tao.properties('lat_ele1 1@0>>1|model general')
+
+def bench_curve_data(tao):
+    return lambda: tao.curve_data('beta.g.a')
+
+
+BENCHMARKS = [
+    ('command', bench_command),
+    ('python', bench_python),
+    ('properties', bench_properties),
+    ('curve_data', bench_curve_data),
+]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 100],
+                        help="number of output lines of python commands")
+    parser.add_argument('--repeat', type=int, default=2000,
+                        help="number of calls per measurement")
+    opts = parser.parse_args(args)
+
+    print('{:<12} {:>6} {:>14} {:>14} {:>8}'.format(
+        'api', 'lines', 'pickle call/s', 'binary call/s', 'speedup'))
+    taos = {protocol: Tao(protocol=protocol)
+            for protocol in ('pickle', 'binary')}
+    try:
+        for lines in opts.lines:
+            for tao in taos.values():
+                tao.command('fake_lines', lines)
+            for name, bench in BENCHMARKS:
+                rates = [1 / measure(bench(taos[protocol]), opts.repeat)[0]
+                         for protocol in ('pickle', 'binary')]
+                print('{:<12} {:>6} {:>14.0f} {:>14.0f} {:>8.2f}'.format(
+                    name, lines, rates[0], rates[1], rates[1] / rates[0]))
+    finally:
+        for tao in taos.values():
+            tao.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+/*
+ * Stand-in for the tao C interface that produces synthetic output.
+ *
+ * Allows building pytao.tao_pipe without a Bmad installation in order to
+ * measure the overhead of pytao itself:
+ *
+ *      python setup.py build_ext --inplace --fake-tao
+ *
+ * The number of generated lines can be set with the init argument
+ * `-fake_lines N` or the command `fake_lines N`. The init argument
+ * `-fake_init_ms N` simulates the time for parsing a lattice. Supported
+ * commands:
+ *
+ *      show ...                print N lines to stdout
+ *      python lat_ele_list     list of N elements
+ *      python lat_ele1 ...     dict with N fields (numeric rows for `floor`)
+ *                              and `k1`; field_i depends linearly on k1
+ *      python plot_list        list of N plots
+ *      python plot1            dict with 2 graphs
+ *      python plot_graph       dict with 2 curves
+ *      python plot_curve       dict with N fields
+ *      python plot_line        N rows of (index, x, y)
+ *      write beam ... FILE     write N particles, or the particles of the
+ *                              last position file, in ASCII format
+ *      set beam_init position_file = FILE
+ *      set element ... k1 = X  set k1 (of all elements)
+ *
+ * All other commands are accepted and ignored.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#include "tao_c_interface_mod.h"
+
+enum { KIND_LIST, KIND_TABLE, KIND_DICT, KIND_PLOT, KIND_GRAPH };
+
+static int n_lines = 100;
+static int n_scratch = 0;
+static int kind = KIND_DICT;
+static int ix_ele = 0;
+static char prefix[32] = "";
+static char line[256];
+static char position_file[1024] = "";
+static double k1 = 0;
+
+static int startswith(const char* s, const char* prefix)
+{
+    return strncmp(s, prefix, strlen(prefix)) == 0;
+}
+
+static const char* skip_word(const char* s, const char* word)
+{
+    if (startswith(s, word))
+        s += strlen(word);
+    while (*s == ' ')
+        ++s;
+    return s;
+}
+
+static const char* last_word(const char* s)
+{
+    const char* p = strrchr(s, ' ');
+    return p ? p + 1 : s;
+}
+
+static void write_beam(const char* filename)
+{
+    FILE* out = fopen(filename, "w");
+    FILE* in;
+    char buf[4096];
+    size_t n;
+    int i;
+    if (!out)
+        return;
+    if (position_file[0] && (in = fopen(position_file, "r"))) {
+        while ((n = fread(buf, 1, sizeof(buf), in)) > 0)
+            fwrite(buf, 1, n, out);
+        fclose(in);
+    } else {
+        fprintf(out, "!ASCII::3\n0\n1\n%d\nBEGIN_BUNCH\n", n_lines);
+        fprintf(out, "electron\n%25.16E\n0.0\n0.0\n", 1e-12*n_lines);
+        for (i = 0; i < n_lines; ++i)
+            fprintf(out, "%25.16E%25.16E%25.16E%25.16E%25.16E%25.16E"
+                    "%25.16E %d\n", 1e-3*i, 1e-6*i, -1e-3*i, -1e-6*i,
+                    1e-4*i, 1e-5*i, 1e-12, 1);
+        fprintf(out, "END_BUNCH\n");
+    }
+    fclose(out);
+}
+
+int tao_c_set_init_args(const char* args)
+{
+    const char* p = strstr(args, "-fake_lines");
+    struct timespec delay;
+    int ms;
+    if (p)
+        n_lines = atoi(p + strlen("-fake_lines"));
+    p = strstr(args, "-fake_init_ms");
+    if (p) {
+        ms = atoi(p + strlen("-fake_init_ms"));
+        delay.tv_sec = ms / 1000;
+        delay.tv_nsec = (ms % 1000) * 1000000L;
+        nanosleep(&delay, NULL);
+    }
+    return 0;
+}
+
+int tao_c_command(const char* cmd)
+{
+    const char* p;
+    int i;
+    cmd = skip_word(cmd, "");
+    if (startswith(cmd, "fake_lines")) {
+        n_lines = atoi(cmd + strlen("fake_lines"));
+        return 0;
+    }
+    if (startswith(cmd, "show")) {
+        for (i = 0; i < n_lines; ++i)
+            printf("%8d  synthetic output line of the show command\n", i);
+        fflush(stdout);
+        return 0;
+    }
+    if (startswith(cmd, "write beam")) {
+        write_beam(last_word(cmd));
+        return 0;
+    }
+    if (startswith(cmd, "set element") && strstr(cmd, " k1 =")) {
+        k1 = atof(strstr(cmd, " k1 =") + strlen(" k1 ="));
+        return 0;
+    }
+    if (startswith(cmd, "set beam_init position_file")) {
+        snprintf(position_file, sizeof(position_file), "%s", last_word(cmd));
+        return 0;
+    }
+    if (!startswith(cmd, "python"))
+        return 0;
+    cmd = skip_word(skip_word(cmd, "python"), "-noprint");
+    n_scratch = n_lines;
+    strcpy(prefix, "field");
+    if (startswith(cmd, "lat_ele_list")) {
+        kind = KIND_LIST;
+        strcpy(prefix, "ELE");
+    } else if (startswith(cmd, "plot_list")) {
+        kind = KIND_LIST;
+        strcpy(prefix, "plot");
+    } else if (startswith(cmd, "plot_line") || strstr(cmd, "floor")) {
+        kind = KIND_TABLE;
+    } else if (startswith(cmd, "plot1")) {
+        kind = KIND_PLOT;
+        n_scratch = 3;
+    } else if (startswith(cmd, "plot_graph")) {
+        kind = KIND_GRAPH;
+        n_scratch = 3;
+    } else {
+        kind = KIND_DICT;
+        n_scratch = n_lines + 1;
+        p = strstr(cmd, ">>");
+        ix_ele = p ? atoi(p + 2) : 0;
+    }
+    return 0;
+}
+
+int tao_c_scratch_n_lines()
+{
+    return n_scratch;
+}
+
+const char* tao_c_scratch_line(int i)
+{
+    if (i < 1 || i > n_scratch) {
+        line[0] = 0;
+    } else if (kind == KIND_LIST) {
+        snprintf(line, sizeof(line), "%d;%s%d", i-1, prefix, i-1);
+    } else if (kind == KIND_TABLE) {
+        snprintf(line, sizeof(line), "%d;%25.16E;%25.16E",
+                 i, 0.5*i, 1.0/i);
+    } else if (kind == KIND_PLOT || kind == KIND_GRAPH) {
+        const char* item = kind == KIND_PLOT ? "graph" : "curve";
+        if (i == 1)
+            snprintf(line, sizeof(line), "num_%ss;INT;F;2", item);
+        else
+            snprintf(line, sizeof(line), "%s[%d];STR;F;%c%d",
+                     item, i-1, item[0], i-1);
+    } else if (i == 1) {
+        snprintf(line, sizeof(line), "s;REAL;F;%25.16E", 0.5*ix_ele);
+    } else if (i == n_scratch) {
+        snprintf(line, sizeof(line), "k1;REAL;T;%25.16E", k1);
+    } else {
+        snprintf(line, sizeof(line), "%s_%d;REAL;T;%25.16E",
+                 prefix, i-1, 0.25*i + ix_ele + k1*(i-1));
+    }
+    return line;
+}
@@ -0,0 +1,160 @@
+# encoding: utf-8
+"""
+Benchmark the overhead of pytao for its most important code paths.
+
+Meant to be used with the synthetic tao stand-in, so it runs on any box
+without a Bmad installation:
+
+    python setup.py build_ext --inplace --fake-tao
+    PYTHONPATH=. python benchmarks/run.py --lines 100 1000 10000
+
+For every API and output size, prints the latency per call, the throughput
+in lines per second and the peak memory allocated by python in the client
+process during the calls. The peak memory of the Tao process is printed at
+the end (linux only).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import tracemalloc
+from timeit import default_timer
+
+from pytao.capture import CaptureIO
+from pytao.tao import Tao, _parse_array
+
+
+# Each benchmark returns a function to be timed and the number of lines
+# processed per call.
+
+def bench_rpc(tao, lines):
+    return (lambda: tao.pipe.scratch_n_lines()), 1
+
+def bench_command(tao, lines):
+    return (lambda: tao.command('set global lattice_calc_on = F')), 1
+
+def bench_command_many(tao, lines):
+    commands = ['set element q{} k1 = 0.1'.format(i) for i in range(lines)]
+    return (lambda: tao.command_many(commands)), lines
+
+def bench_python(tao, lines):
+    return (lambda: tao.python('lat_ele_list 1@0')), lines
+
+def bench_properties(tao, lines):
+    return (lambda: tao.properties('lat_ele1 1@0>>1|model general')), lines
+
+def bench_curve_data(tao, lines):
+    return (lambda: tao.curve_data('beta.g.a')), lines
+
+def bench_lattice_table(tao, lines):
+    # this does `lines` python commands with `lines` lines each inside the
+    # Tao process, so limit the size:
+    lines = min(lines, 1000)
+    tao.command('fake_lines', lines)
+    return (lambda: tao.lattice_table(['s', 'field_1'])), lines*lines
+
+def bench_get_beam(tao, lines):
+    return (lambda: tao.get_beam('end')), lines
+
+def bench_capture(tao, lines):
+    return (lambda: tao.capture('show lattice')), lines
+
+def bench_capture_iter(tao, lines):
+    return (lambda: sum(1 for _ in tao.capture_iter('show lattice'))), lines
+
+def bench_parse_dict(tao, lines):
+    data = tao.python('lat_ele1 1@0>>1|model general')
+    return (lambda: tao._parse_dict(data)), lines
+
+def bench_parse_array(tao, lines):
+    data = tao.python('plot_line beta.g.a')
+    return (lambda: _parse_array(data)), lines
+
+def bench_captureio(tao, lines):
+    text = b'synthetic output line of the show command\n' * lines
+    capture = CaptureIO()
+    return (lambda: capture.capture(os.write, CaptureIO.STDOUT, text)), lines
+
+
+BENCHMARKS = [
+    ('rpc', bench_rpc),
+    ('command', bench_command),
+    ('command_many', bench_command_many),
+    ('python', bench_python),
+    ('properties', bench_properties),
+    ('curve_data', bench_curve_data),
+    ('lattice_table', bench_lattice_table),
+    ('get_beam', bench_get_beam),
+    ('capture', bench_capture),
+    ('capture_iter', bench_capture_iter),
+    ('_parse_dict', bench_parse_dict),
+    ('_parse_array', bench_parse_array),
+    ('CaptureIO', bench_captureio),
+]
+
+
+def measure(func, repeat):
+    """Return (best time per call, peak memory) for calling `func`."""
+    # tracing allocations slows down the calls considerably, so measure
+    # memory in a separate run, which also warms up caches:
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best = float('inf')
+    for _ in range(repeat):
+        start = default_timer()
+        func()
+        best = min(best, default_timer() - start)
+    return best, peak
+
+
+def peak_rss(pid):
+    """Return peak resident set size of a process in KiB (linux only)."""
+    try:
+        with open('/proc/{}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except IOError:
+        return None
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--lines', type=int, nargs='+',
+                        default=[10, 1000, 100000],
+                        help="number of output lines produced by tao")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help="number of calls per measurement")
+    parser.add_argument('--only', nargs='+', metavar='NAME',
+                        help="run only the given benchmarks")
+    parser.add_argument('initargs', nargs='*',
+                        help="additional arguments for Tao")
+    opts = parser.parse_args(args)
+    benchmarks = [(name, bench) for name, bench in BENCHMARKS
+                  if not opts.only or name in opts.only]
+
+    tao = Tao(*opts.initargs)
+    print('{:<14} {:>8} {:>12} {:>14} {:>12}'.format(
+        'benchmark', 'lines', 'ms/call', 'lines/s', 'peak KiB'))
+    for lines in opts.lines:
+        for name, bench in benchmarks:
+            tao.command('fake_lines', lines)
+            func, count = bench(tao, lines)
+            best, peak = measure(func, opts.repeat)
+            print('{:<14} {:>8} {:>12.4f} {:>14.0f} {:>12.1f}'.format(
+                name, lines, best*1e3, count/best, peak/1024))
+    print('Peak RSS of Tao process: {} KiB'.format(
+        peak_rss(tao._process.pid)))
+    tao.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+# encoding: utf-8
+"""
+Asyncio frontend for Tao.
+
+Example:
+
+    >>> from pytao.aio import AsyncTao
+
+    >>> async def main():
+    ...     async with AsyncTao('-lat', 'my_lat.bmad') as tao:
+    ...         await tao.command('set element qp1 k1 = 0.1')
+    ...         beta, orbit = await asyncio.gather(
+    ...             tao.properties('lat_ele1 1@0>>end|model twiss'),
+    ...             tao.properties('lat_ele1 1@0>>end|model orbit'))
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import asyncio
+import io
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from minrpc.client import RemoteProcessCrashed
+
+from pytao import wire
+from pytao.service import connect_fifos
+from pytao.tao import (
+    Tao, join_args, _array_from_buffer, _parse_list, _split_rows)
+from pytao.transport import receive
+
+
+__all__ = [
+    'AsyncTao',
+]
+
+
+class AsyncTao(object):
+
+    """
+    Non-blocking interface to a Tao process for use with :mod:`asyncio`.
+
+    All methods return awaitables immediately and must be called from the
+    thread of the event loop. Requests are sent in the order of the method
+    calls. On posix, the event loop writes them to the Tao process using
+    the binary protocol of :mod:`pytao.wire` without waiting for the replies
+    of earlier requests, so multiple requests can be in flight. The Tao
+    process executes them one after another, so results always reflect the
+    order in which the requests were issued. On other platforms, requests
+    are executed one after another by a worker thread.
+
+    Unlike :class:`~pytao.tao.Tao`, the results are never cached.
+    """
+
+    def __init__(self, *initargs, **kwargs):
+        """
+        Start the Tao process in the background. Arguments are the same as
+        for :class:`~pytao.tao.Tao`.
+        """
+        self._loop = asyncio.get_event_loop()
+        self._tao = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._queue = deque()       # requests that have not been sent yet
+        self._sent = deque()        # requests waiting for their replies
+        self._buffer = bytearray()
+        self._reader = self._writer = None
+        self._error = None
+        # future of close():
+        self._closed = None
+        # while the worker thread uses the Tao process:
+        self._busy = True
+        self._started = asyncio.ensure_future(
+            self._start(initargs, kwargs), loop=self._loop)
+
+    def ready(self):
+        """Wait until the Tao process has been started."""
+        return self._started
+
+    def command(self, *command):
+        """Send a command, see :meth:`Tao.command`."""
+        cmd = join_args(command)
+        return self._request([('command', cmd)], [cmd], lambda status: None)
+
+    def command_many(self, commands):
+        """Send multiple commands, see :meth:`Tao.command_many`."""
+        cmds = [c if isinstance(c, str) else join_args(c) for c in commands]
+        return self._request([('commands', cmds)], cmds)
+
+    def capture(self, *command):
+        """Send a command and return its output, see :meth:`Tao.capture`."""
+        cmd = join_args(command)
+        return self._request([('capture', cmd)], [cmd])
+
+    def python(self, *command):
+        """Execute a python command, see :meth:`Tao.python`."""
+        return self._python(command, lambda rows: rows)
+
+    def get_list(self, *qualname):
+        """Execute a python command, see :meth:`Tao.get_list`."""
+        return self._python(qualname, _parse_list)
+
+    def properties(self, *qualname):
+        """Execute a python command, see :meth:`Tao.properties`."""
+        return self._python(qualname, lambda rows: self._tao._parse_dict(rows))
+
+    def parameters(self, *qualname):
+        """Execute a python command, see :meth:`Tao.parameters`."""
+        return self._python(qualname, lambda rows:
+                            self._tao._parse_param_dict(rows))
+
+    def curve_data(self, name):
+        """Get curve data, see :meth:`Tao.curve_data`."""
+        cmd = join_args(('python', '-noprint', 'plot_line', name))
+        return self._request(
+            [('command', cmd), ('scratch_array', None)], [cmd],
+            lambda result: _array_from_buffer(
+                result[0], result[1], (0, 3))[:,1:])
+
+    def call(self, func, *args, **kwargs):
+        """
+        Execute ``func(tao, *args, **kwargs)`` in a worker thread, e.g. to
+        run multiple synchronous calls on the underlying :class:`Tao` without
+        interleaving other requests. It runs after all earlier requests have
+        finished, and later requests are sent after it has finished.
+        """
+        return self._issue(_Call(self._loop.create_future(), lambda tao:
+                                 func(tao, *args, **kwargs)))
+
+    def close(self):
+        """Stop the Tao process after finishing the pending requests."""
+        if self._closed is not None:
+            return self._closed
+        if self._error is not None and self._tao is not None:
+            # clean up after a crash:
+            self._closed = self._loop.run_in_executor(
+                self._executor, self._tao.close)
+        else:
+            self._closed = self.call(Tao.close)
+        self._closed.add_done_callback(self._shutdown)
+        return self._closed
+
+    async def __aenter__(self):
+        await self.ready()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _start(self, initargs, kwargs):
+        loop = self._loop
+        try:
+            self._tao = await loop.run_in_executor(
+                self._executor, partial(Tao, *initargs, **kwargs))
+            if hasattr(os, 'mkfifo'):
+                recv_fd, send_fd, _ = await loop.run_in_executor(
+                    self._executor, connect_fifos, self._tao.pipe.wire_open)
+                self._reader, _ = await loop.connect_read_pipe(
+                    partial(_Receiver, self), io.open(recv_fd, 'rb', 0))
+                self._writer, _ = await loop.connect_write_pipe(
+                    asyncio.Protocol, io.open(send_fd, 'wb', 0))
+        except Exception as e:
+            self._fail(e)
+            raise
+        finally:
+            self._busy = False
+            self._pump()
+
+    def _python(self, command, parse):
+        cmd = join_args(('python', '-noprint') + command)
+        return self._request(
+            [('command', cmd), ('scratch_text', None)], [cmd],
+            lambda text: parse(_split_rows(receive(text))))
+
+    def _request(self, calls, commands, finish=None):
+        return self._issue(_Request(
+            self._loop.create_future(), calls, commands, finish))
+
+    def _issue(self, item):
+        if self._error is not None:
+            item.future.set_exception(self._error)
+        elif self._closed is not None:
+            item.future.set_exception(RuntimeError("Tao has been closed."))
+        else:
+            self._queue.append(item)
+            self._pump()
+        return item.future
+
+    def _pump(self):
+        """Send queued requests until a call needs the worker thread."""
+        while self._queue and not self._busy:
+            item = self._queue[0]
+            if isinstance(item, _Request):
+                for cmd in item.commands:
+                    self._tao._log_command(cmd)
+                    self._tao._invalidate_for(cmd)
+                if self._writer is not None:
+                    self._queue.popleft()
+                    self._sent.append(item)
+                    for name, args in item.calls:
+                        self._writer.write(wire.encode_request(name, args))
+                    continue
+                item = _Call(item.future, item.run)
+            if self._sent:
+                break           # wait for the replies
+            self._queue.popleft()
+            self._busy = True
+            future = self._loop.run_in_executor(
+                self._executor, item.func, self._tao)
+            future.add_done_callback(partial(self._finished, item))
+
+    def _finished(self, call, future):
+        self._busy = False
+        _transfer(future, call.future)
+        self._pump()
+
+    def _received(self, data):
+        self._buffer += data
+        for status, payload in wire.split_frames(self._buffer):
+            if self._sent[0].reply(status, payload):
+                self._sent.popleft()
+        self._pump()
+
+    def _lost(self):
+        self._reader = self._writer = None
+        if self._closed is None:
+            if self._tao._service is not None:
+                self._tao._service.mark_crashed()
+            self._fail(RemoteProcessCrashed())
+
+    def _fail(self, error):
+        """Fail all pending and future requests with `error`."""
+        self._error = error
+        while self._sent:
+            _settle(self._sent.popleft().future, error=error)
+        while self._queue:
+            _settle(self._queue.popleft().future, error=error)
+
+    def _shutdown(self, future):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader.close()
+        self._executor.shutdown(wait=False)
+
+
+class _Request(object):
+
+    """Calls of functions in :data:`pytao.wire.OPCODES` whose result is
+    computed from the result of the last one."""
+
+    def __init__(self, future, calls, commands, finish=None):
+        self.future = future
+        self.calls = calls          # [(name, args)]
+        self.commands = commands    # for the command log
+        self.finish = finish
+        self._replies = 0
+        self._error = None
+
+    def reply(self, status, payload):
+        """Handle the next reply. Returns whether the request is done."""
+        name = self.calls[self._replies][0]
+        self._replies += 1
+        try:
+            result = wire.decode_reply(name, status, payload)
+        except Exception as e:
+            self._error = self._error or e
+        if self._replies < len(self.calls):
+            return False
+        if self._error is not None:
+            _settle(self.future, error=self._error)
+        else:
+            _settle(self.future, partial(self._finish, result))
+        return True
+
+    def run(self, tao):
+        """Make the calls via the pipe of `tao` (blocking)."""
+        for name, args in self.calls:
+            func = getattr(tao.pipe, name)
+            result = func() if args is None else func(args)
+        return self._finish(result)
+
+    def _finish(self, result):
+        return result if self.finish is None else self.finish(result)
+
+
+class _Call(object):
+
+    """Function to call with the :class:`Tao` in the worker thread."""
+
+    def __init__(self, future, func):
+        self.future = future
+        self.func = func
+
+
+class _Receiver(asyncio.Protocol):
+
+    """Forwards the replies from the Tao process to :class:`AsyncTao`."""
+
+    def __init__(self, tao):
+        self._tao = tao
+
+    def data_received(self, data):
+        self._tao._received(data)
+
+    def connection_lost(self, exc):
+        self._tao._lost()
+
+
+def _settle(future, compute=None, error=None):
+    """Set the result of ``compute()`` or `error` unless the `future` has
+    been cancelled."""
+    if future.done():
+        return
+    if error is None:
+        try:
+            future.set_result(compute())
+            return
+        except Exception as e:
+            error = e
+    future.set_exception(error)
+
+
+def _transfer(source, future):
+    if source.exception() is None:
+        _settle(future, source.result)
+    else:
+        _settle(future, error=source.exception())
@@ -0,0 +1,67 @@
+# encoding: utf-8
+"""
+LRU cache for the results of python commands.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from collections import namedtuple, OrderedDict
+
+
+__all__ = [
+    'CacheInfo',
+    'ResultCache',
+]
+
+
+CacheInfo = namedtuple('CacheInfo', [
+    'hits', 'misses', 'evictions', 'invalidations', 'maxsize', 'currsize'])
+
+
+class ResultCache(object):
+
+    """
+    Least recently used cache with hit and miss counters.
+
+    Values are returned as stored, i.e. callers must not modify them.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._data = OrderedDict()
+
+    def get(self, key, compute):
+        """Return the value for `key`, or compute and store it."""
+        data = self._data
+        try:
+            value = data.pop(key)
+        except KeyError:
+            self.misses += 1
+            value = compute()
+            while len(data) >= self.maxsize and data:
+                data.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+        if self.maxsize > 0:
+            data[key] = value
+        return value
+
+    def clear(self):
+        """Remove all entries."""
+        if self._data:
+            self._data.clear()
+            self.invalidations += 1
+
+    def info(self):
+        """Return statistics as :class:`CacheInfo`."""
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         self.invalidations, self.maxsize, len(self._data))
+
+    def __len__(self):
+        return len(self._data)
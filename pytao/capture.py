@@ -1,25 +1,51 @@
-
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import os
-import select
+import sys
+import tempfile
+import threading
+
+
+# Don't rely on the platform default for the size of the thread stack,
+# Fortran code may allocate large arrays on the stack:
+STACK_SIZE = 64 * 1024 * 1024
+
+
+def start_thread(thread, stack_size=STACK_SIZE):
+    """Start a thread that may run Tao commands with a large stack."""
+    previous = threading.stack_size(stack_size)
+    try:
+        thread.start()
+    finally:
+        threading.stack_size(previous)
 
 
 def capture(func, *args, **kwargs):
-    return CaptureIO().capture(func, *args, **kwargs)
+    io = CaptureIO()
+    try:
+        return io.capture(func, *args, **kwargs)
+    finally:
+        io.close()
 
 
 class CaptureIO(object):
 
     """
     Utility for redirecting STDIO streams.
+
+    The output is redirected into an anonymous temporary file. Unlike a pipe,
+    the file never blocks the writer, so commands with arbitrarily large
+    output can not deadlock, and the output is read back in one piece after
+    the command has finished. The file is truncated and reused on every
+    capture, so an instance can be kept around for the lifetime of the
+    process without accumulating file descriptors.
     """
 
     STDOUT = 1
 
     def __init__(self, fd=STDOUT):
-        self.pipe_out, self.pipe_in = os.pipe()
+        self.sink = tempfile.TemporaryFile()
         self.fd = fd
 
     def capture(self, func, *args, **kwargs):
@@ -28,13 +54,18 @@ class CaptureIO(object):
         return self.read()
 
     def enter(self):
-        """Replace stdout with our write pipe."""
+        """Replace stdout with our temporary file."""
+        sink = self.sink.fileno()
+        os.ftruncate(sink, 0)
+        os.lseek(sink, 0, os.SEEK_SET)
+        _flush_stdio()
         self.restore = os.dup(self.fd)
-        os.dup2(self.pipe_in, self.fd)
+        os.dup2(sink, self.fd)
         return self
 
     def exit(self, *args):
         """Restore to terminal."""
+        _flush_stdio()
         os.dup2(self.restore, self.fd)
         os.close(self.restore)
         del self.restore
@@ -44,13 +75,92 @@ class CaptureIO(object):
 
     __exit__ = exit
 
-    def more_data(self):
-        """Check if we have more to read from the pipe."""
-        r, _, _ = select.select([self.pipe_out], [], [], 0)
-        return bool(r)
-
     def read(self):
-        out = ''
-        while self.more_data():
-            out += os.read(self.pipe_out, 1024).decode('utf-8')
-        return out
+        """Return the output of the last capture as string."""
+        sink = self.sink.fileno()
+        size = os.lseek(sink, 0, os.SEEK_END)
+        os.lseek(sink, 0, os.SEEK_SET)
+        chunks = []
+        while size > 0:
+            chunk = os.read(sink, size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks).decode('utf-8', 'replace')
+
+    def close(self):
+        """Close the temporary file."""
+        self.sink.close()
+
+
+class CaptureStream(object):
+
+    """
+    Execute a function in a background thread while redirecting STDIO to a
+    pipe that can be read incrementally.
+
+    The pipe applies back pressure: the function blocks when the pipe buffer
+    is full, until the output is consumed with :meth:`read`. This keeps the
+    memory usage constant independent of the output size.
+    """
+
+    STDOUT = 1
+
+    STACK_SIZE = STACK_SIZE
+
+    def __init__(self, func, *args):
+        """Redirect stdout and start executing ``func(*args)``."""
+        self.fd = self.STDOUT
+        self.result = None
+        self.error = None
+        self.pipe_out, pipe_in = os.pipe()
+        _flush_stdio()
+        self.restore = os.dup(self.fd)
+        os.dup2(pipe_in, self.fd)
+        os.close(pipe_in)
+        self.thread = threading.Thread(target=self._run, args=(func, args))
+        self.thread.daemon = True
+        start_thread(self.thread, self.STACK_SIZE)
+
+    def _run(self, func, args):
+        try:
+            self.result = func(*args)
+        except BaseException as e:
+            self.error = e
+        finally:
+            # Restore stdout, this closes the last write end of the pipe and
+            # signals EOF to the reader:
+            _flush_stdio()
+            os.dup2(self.restore, self.fd)
+            os.close(self.restore)
+
+    def read(self, size=65536):
+        """
+        Wait for output and return the next chunk of up to `size` bytes.
+        Returns empty bytes when the function has finished.
+        """
+        return os.read(self.pipe_out, size)
+
+    def close(self):
+        """
+        Discard remaining output and wait for the function to finish. Returns
+        the result of the function or re-raises its exception.
+        """
+        while self.read():
+            pass
+        self.thread.join()
+        os.close(self.pipe_out)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _flush_stdio():
+    """Flush python's buffers for the standard streams."""
+    for stream in (sys.stdout, sys.stderr):
+        if stream is not None:
+            try:
+                stream.flush()
+            except (IOError, ValueError):
+                pass
@@ -0,0 +1,235 @@
+# encoding: utf-8
+"""
+Lazy proxies for the elements of a lattice.
+
+Example:
+
+    >>> ring = tao.lattice[0]           # branch 0 of universe 1
+    >>> len(ring)
+    20000
+    >>> ring[10].twiss['beta_a']        # fetches only the twiss group
+    12.3
+    >>> ring['Q1']['l']                 # looks up an element by name
+    0.5
+    >>> quads = ring[100:110]
+    >>> ring.prefetch(quads, 'general', 'twiss')    # single round trip
+
+Attribute groups of an element are fetched with ``python lat_ele1`` on
+first access and memoized until the next command that may change the
+state of Tao (see :attr:`Tao.generation <pytao.tao.Tao.generation>`).
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from operator import index as _index
+
+from pytao.tao import _parse_array, _parse_list, basestring
+
+
+__all__ = [
+    'Lattice',
+    'Branch',
+    'Element',
+]
+
+
+# Attribute groups of ``python lat_ele1`` that are available as attributes
+# of an element:
+GROUPS = ('general', 'parameters', 'multipole', 'elec_multipole',
+          'lord_slave', 'twiss', 'orbit', 'floor', 'mat6')
+
+# Groups with numeric table output, returned as arrays:
+ARRAY_GROUPS = ('floor', 'mat6')
+
+# Groups that are searched for attributes by ``element[name]``:
+DEFAULT_GROUPS = ('general', 'parameters', 'twiss', 'orbit')
+
+
+class Lattice(object):
+
+    """
+    The lattice branches of a :class:`~pytao.tao.Tao` instance, indexed by
+    branch number or a tuple ``(universe, branch)``.
+    """
+
+    def __init__(self, tao, which='model'):
+        self._tao = tao
+        self._which = which
+        self._branches = {}
+
+    def __getitem__(self, key):
+        universe, branch = key if isinstance(key, tuple) else (1, key)
+        try:
+            return self._branches[universe, branch]
+        except KeyError:
+            proxy = self._branches[universe, branch] = Branch(
+                self._tao, universe, branch, self._which)
+            return proxy
+
+
+class Branch(object):
+
+    """
+    Sequence of :class:`Element` proxies of a lattice branch. Elements can
+    be accessed by index, slice or name. The element list is fetched on
+    first use.
+    """
+
+    def __init__(self, tao, universe=1, branch=0, which='model'):
+        self.tao = tao
+        self.universe = universe
+        self.branch = branch
+        self.which = which
+        self._names = None
+        self._indices = None
+        self._elements = {}
+        self._generation = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        names = self.names
+        if isinstance(key, basestring):
+            index = self._indices[key.upper()]
+        else:
+            index = _index(key)
+            if index < 0:
+                index += len(names)
+            if not 0 <= index < len(names):
+                raise IndexError("Element index out of range: {}"
+                                 .format(key))
+        element = self._elements.get(index)
+        if element is None:
+            element = self._elements[index] = Element(
+                self, index, names[index])
+        return element
+
+    @property
+    def names(self):
+        """List of element names."""
+        self._validate()
+        if self._names is None:
+            self._names = _parse_list(self.tao.python(
+                'lat_ele_list {}@{}'.format(self.universe, self.branch)))
+            self._indices = {}
+            for i, name in enumerate(self._names):
+                self._indices.setdefault(name.upper(), i)
+        return self._names
+
+    def prefetch(self, elements, *groups):
+        """
+        Fetch the given attribute groups (default: ``'general'``) for
+        multiple elements in a single round trip. `elements` can be a list
+        of :class:`Element` or indices, or a slice.
+        """
+        if isinstance(elements, slice):
+            elements = self[elements]
+        elements = [e if isinstance(e, Element) else self[e]
+                    for e in elements]
+        groups = groups or ('general',)
+        for group in groups:
+            _check_group(group)
+        missing = [(element, group)
+                   for element in elements
+                   for group in groups
+                   if group not in element._valid_groups()]
+        if not missing:
+            return
+        outputs = self.tao._python_many([
+            element._command(group) for element, group in missing])
+        for (element, group), rows in zip(missing, outputs):
+            element._groups[group] = element._parse(group, rows)
+
+    def _command(self, index, group):
+        return 'lat_ele1 {}@{}>>{}|{} {}'.format(
+            self.universe, self.branch, index, self.which, group)
+
+    def _validate(self):
+        """Discard memoized data if the state of Tao may have changed."""
+        generation = self.tao.generation
+        if self._generation != generation:
+            self._generation = generation
+            self._names = None
+            self._indices = None
+            self._elements.clear()
+
+
+class Element(object):
+
+    """
+    Proxy for a lattice element. The attribute groups are available as
+    attributes (``element.twiss``, ``element.floor``, ...) and fetched on
+    first access. ``element[name]`` looks up an attribute in the groups
+    ``general``, ``parameters``, ``twiss`` and ``orbit``.
+    """
+
+    __slots__ = ('_branch', 'index', 'name', '_groups', '_generation')
+
+    def __init__(self, branch, index, name):
+        self._branch = branch
+        self.index = index
+        self.name = name
+        self._groups = {}
+        self._generation = branch.tao.generation
+
+    def __repr__(self):
+        return '<{} {}: {}>'.format(
+            self.__class__.__name__, self.index, self.name)
+
+    def __getattr__(self, name):
+        if name in GROUPS:
+            return self.group(name)
+        raise AttributeError("{!r} object has no attribute {!r}".format(
+            self.__class__.__name__, name))
+
+    def __getitem__(self, name):
+        for group in DEFAULT_GROUPS:
+            values = self.group(group)
+            if name in values:
+                return values[name]
+        raise KeyError(name)
+
+    def group(self, group):
+        """Return the values of an attribute group as dictionary (or array
+        for ``floor`` and ``mat6``)."""
+        _check_group(group)
+        groups = self._valid_groups()
+        try:
+            return groups[group]
+        except KeyError:
+            tao = self._branch.tao
+            command = self._command(group)
+            if group in ARRAY_GROUPS:
+                value = tao._python_array((0, 0), command)
+            else:
+                value = tao.properties(command)
+            groups[group] = value
+            return value
+
+    def _valid_groups(self):
+        """Return the memoized groups, after discarding outdated values."""
+        generation = self._branch.tao.generation
+        if self._generation != generation:
+            self._generation = generation
+            self._groups.clear()
+        return self._groups
+
+    def _command(self, group):
+        return self._branch._command(self.index, group)
+
+    def _parse(self, group, rows):
+        if group in ARRAY_GROUPS:
+            return _parse_array(rows)
+        return self._branch.tao._parse_dict(rows)
+
+
+def _check_group(group):
+    if group not in GROUPS:
+        raise ValueError("Unknown attribute group: {!r}".format(group))
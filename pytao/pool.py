@@ -0,0 +1,152 @@
+# encoding: utf-8
+"""
+Pool of Tao worker processes for running independent jobs in parallel.
+
+Example:
+
+    >>> from pytao.pool import TaoPool
+
+    >>> def beta_at_end(tao, k1):
+    ...     tao.change('element', 'qp1', k1=k1)
+    ...     tao.update()
+    ...     return tao.get_element_data('end', who='twiss')['beta_a']
+
+    >>> with TaoPool('-lat', 'my_lat.bmad', processes=4) as pool:
+    ...     betas = pool.map(beta_at_end, [0.1, 0.2, 0.3, 0.4])
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import logging
+from multiprocessing import cpu_count
+from threading import Thread
+
+try:
+    import queue
+except ImportError:             # python2
+    import Queue as queue
+
+from concurrent.futures import Future
+
+from pytao.tao import Tao
+
+
+__all__ = [
+    'TaoPool',
+]
+
+
+class TaoPool(object):
+
+    """
+    Pool of :class:`~pytao.tao.Tao` processes that are started with the same
+    command line arguments and kept running until the pool is closed.
+
+    Jobs are functions that receive a :class:`~pytao.tao.Tao` instance as
+    first argument. Each worker process is driven by its own thread in this
+    process; since the threads spend their time waiting for the Tao
+    processes, jobs run in parallel on all workers.
+    """
+
+    def __init__(self, *initargs, **kwargs):
+        """
+        Start the worker processes.
+
+            :param initargs: command line arguments for tao
+            :param int processes: number of workers (default: CPU count)
+            :param list prefix: commands to execute on every worker after
+                                startup (also after restarting a crashed
+                                worker)
+            :param kwargs: further arguments for :class:`~pytao.tao.Tao`
+
+        Pass ``template=TaoTemplate(...)`` (and no initargs) to fork the
+        workers from an initialized process, which also speeds up restarts,
+        see :class:`~pytao.tao.TaoTemplate`.
+        """
+        self.processes = kwargs.pop('processes', None) or cpu_count()
+        self.prefix = list(kwargs.pop('prefix', ()))
+        self._initargs = initargs
+        self._kwargs = kwargs
+        self._tasks = queue.Queue()
+        started = [Future() for _ in range(self.processes)]
+        self._threads = [
+            Thread(target=self._run_worker, args=(future,))
+            for future in started
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            for future in started:
+                future.result()
+        except BaseException:
+            self.close()
+            raise
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedule ``func(tao, *args, **kwargs)`` to be executed on the next
+        free worker and return a :class:`~concurrent.futures.Future`.
+        """
+        future = Future()
+        self._tasks.put((future, func, args, kwargs))
+        return future
+
+    def map(self, func, *iterables):
+        """
+        Execute ``func(tao, *args)`` for the items of the given iterables in
+        parallel and return the list of results in the same order.
+        """
+        futures = [self.submit(func, *args) for args in zip(*iterables)]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Stop all workers after finishing the pending jobs."""
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _spawn(self):
+        """Start a new Tao worker process and replay the command prefix."""
+        tao = Tao(*self._initargs, **self._kwargs)
+        if self.prefix:
+            tao.command_many(self.prefix)
+        return tao
+
+    def _run_worker(self, started):
+        try:
+            tao = self._spawn()
+        except BaseException as e:
+            started.set_exception(e)
+            return
+        started.set_result(None)
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    break
+                future, func, args, kwargs = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = func(tao, *args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                if not tao:
+                    logging.getLogger(__name__).warn(
+                        "Tao worker has crashed, restarting.")
+                    tao = self._spawn()
+        finally:
+            if tao:
+                tao.close()
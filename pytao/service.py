@@ -0,0 +1,217 @@
+# encoding: utf-8
+"""
+RPC client and service for communicating with the Tao process.
+
+These are thin wrappers around the :mod:`minrpc` classes that make the
+connection usable for messages larger than the OS pipe buffer: minrpc
+unpickles directly from an unbuffered pipe, where reads can return fewer
+bytes than requested.
+
+On posix, a running service can also be forked to create a copy of its
+state that is served over a new connection, see :meth:`Client.fork`.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+from minrpc import client, service
+from minrpc.connection import Connection
+
+
+__all__ = [
+    'Client',
+    'Service',
+    'ForkedProcess',
+    'register_after_fork',
+    'connect_fifos',
+]
+
+
+# Functions to call in the child process after forking a service:
+_after_fork = []
+
+
+def register_after_fork(func):
+    """Register a function to be called in forked services, e.g. to reset
+    resources that must not be shared with the parent process."""
+    _after_fork.append(func)
+
+
+def connect_fifos(request):
+    """
+    Create a pair of named pipes and call ``request(recv_path, send_path)``,
+    which must make the peer open `recv_path` for reading and then
+    `send_path` for writing (posix only).
+
+    Returns ``(recv_fd, send_fd, result)`` where ``result`` is the return
+    value of `request`. The paths are removed once both sides are
+    connected.
+    """
+    tmpdir = tempfile.mkdtemp(prefix='pytao-')
+    try:
+        # paths as seen from the peer:
+        recv_path = os.path.join(tmpdir, 'recv')
+        send_path = os.path.join(tmpdir, 'send')
+        os.mkfifo(recv_path)
+        os.mkfifo(send_path)
+        result = request(recv_path, send_path)
+        # open in the same order as the peer to avoid a deadlock:
+        send_fd = os.open(recv_path, os.O_WRONLY)
+        recv_fd = os.open(send_path, os.O_RDONLY)
+    finally:
+        shutil.rmtree(tmpdir)
+    return recv_fd, send_fd, result
+
+
+def _buffer_recv(conn):
+    """Make the receiving end of the connection buffered."""
+    conn._recv = io.BufferedReader(conn._recv)
+    return conn
+
+
+class Client(client.Client):
+
+    """RPC client that spawns a :class:`Service` subprocess."""
+
+    module = 'pytao.service'
+
+    def __init__(self, conn, lock=None):
+        super(Client, self).__init__(_buffer_recv(conn), lock)
+
+    def mark_crashed(self):
+        """Mark the connection as broken, when the service process was
+        found dead through another channel."""
+        self._good = False
+        self._conn.close()
+
+    def fork(self, lock=None):
+        """
+        Fork the service process. Returns a new client for the child
+        process, and a :class:`ForkedProcess` handle (posix only).
+
+        The child process starts with a copy of the state of the service
+        and is connected via a pair of named pipes.
+        """
+        recv_fd, send_fd, pid = connect_fifos(
+            lambda recv_path, send_path:
+            self._request('fork', recv_path, send_path))
+        conn = Connection.from_fd(recv_fd, send_fd)
+        return type(self)(conn, lock=lock), ForkedProcess(pid)
+
+
+class Service(service.Service):
+
+    """RPC service that can receive large requests."""
+
+    def __init__(self, conn):
+        super(Service, self).__init__(_buffer_recv(conn))
+
+    def _dispatch_fork(self, recv_path, send_path):
+        """Fork the process and serve the child on the given named pipes.
+        Returns the child pid to the client."""
+        # Fork twice, so the child is adopted by init and doesn't have to
+        # be waited for. The intermediate process passes on the child pid:
+        recv_fd, send_fd = os.pipe()
+        pid = os.fork()
+        if pid != 0:
+            os.close(send_fd)
+            with os.fdopen(recv_fd, 'rb') as f:
+                child_pid = f.read()
+            os.waitpid(pid, 0)
+            return int(child_pid)
+        status = 1
+        try:
+            os.close(recv_fd)
+            pid = os.fork()
+            if pid != 0:
+                os.write(send_fd, str(pid).encode('ascii'))
+                status = 0
+                return
+            os.close(send_fd)
+            self._conn.close()
+            for func in _after_fork:
+                func()
+            recv_fd = os.open(recv_path, os.O_RDONLY)
+            send_fd = os.open(send_path, os.O_WRONLY)
+            conn = Connection.from_fd(recv_fd, send_fd)
+            try:
+                type(self)(conn).run()
+            finally:
+                conn.close()
+            status = 0
+        finally:
+            # never return into the serve loop of the parent:
+            os._exit(status)
+
+
+class ForkedProcess(object):
+
+    """
+    Handle for a process created by :meth:`Client.fork`. Provides a subset
+    of the :class:`subprocess.Popen` interface.
+
+    The process is not a child of the current process, so its exit status
+    is not available, and :meth:`wait` polls until the process is gone.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        """Return ``0`` if the process has exited, else ``None``."""
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, 0)
+            except OSError:
+                self.returncode = 0
+            else:
+                # the process may not be reaped immediately by its new
+                # parent:
+                if _is_zombie(self.pid):
+                    self.returncode = 0
+        return self.returncode
+
+    def wait(self, timeout=None):
+        """Wait for the process to exit."""
+        deadline = None if timeout is None else time.time() + timeout
+        delay = 0.0005
+        while self.poll() is None:
+            if deadline is not None and time.time() > deadline:
+                raise RuntimeError("Process {} did not exit within {} s."
+                                   .format(self.pid, timeout))
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        return self.returncode
+
+    def terminate(self):
+        os.kill(self.pid, signal.SIGTERM)
+
+    def kill(self):
+        os.kill(self.pid, signal.SIGKILL)
+
+
+def _is_zombie(pid):
+    """Check if a process has exited but not been reaped (linux only)."""
+    try:
+        with open('/proc/{}/stat'.format(pid), 'rb') as f:
+            stat = f.read()
+    except (IOError, OSError):
+        return False
+    # the command name in parentheses may contain spaces:
+    return stat[stat.rfind(b')')+2:][:1] == b'Z'
+
+
+if __name__ == '__main__':
+    # Run the service from the importable module, so that it shares state,
+    # e.g. the after fork hooks, with the modules that import it:
+    from pytao.service import Service
+    Service.stdio_main(sys.argv[1:])
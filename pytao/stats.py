@@ -0,0 +1,179 @@
+# encoding: utf-8
+"""
+Per-command latency and payload statistics.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from bisect import bisect_left
+
+
+__all__ = [
+    'CommandStats',
+    'command_verb',
+]
+
+
+# Upper bounds of the latency histogram buckets in seconds:
+BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+
+def command_verb(cmd):
+    """
+    Return the part of a command that identifies its kind, i.e. the first
+    word, and for python commands also the name of the python command:
+
+        >>> command_verb('python -noprint lat_ele1 1@0>>1|model twiss')
+        'python lat_ele1'
+        >>> command_verb('set element q1 k1 = 0.1')
+        'set'
+    """
+    words = cmd.split(None, 3)
+    if not words:
+        return ''
+    if words[0] == 'python':
+        for word in words[1:]:
+            if not word.startswith('-'):
+                return 'python ' + word
+    return words[0]
+
+
+class Histogram(object):
+
+    """Latency histogram with fixed buckets."""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def add(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def as_dict(self):
+        return {
+            'buckets': dict(zip(BUCKETS + (float('inf'),), self.counts)),
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+
+class VerbStats(object):
+
+    """Statistics for a single command verb."""
+
+    __slots__ = ('calls', 'lines', 'bytes', 'phases')
+
+    def __init__(self):
+        self.calls = 0
+        self.lines = 0
+        self.bytes = 0
+        self.phases = {}
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'phases': {phase: hist.as_dict()
+                       for phase, hist in self.phases.items()},
+        }
+
+
+class CommandStats(object):
+
+    """
+    Collect call counts, latency histograms per phase, and the number of
+    lines and bytes transferred for each command verb (see
+    :func:`command_verb`).
+
+    The phases are ``'command'`` (sending the command and executing it in
+    Tao), ``'scratch'`` (fetching the output of python commands),
+    ``'parse'`` (converting it to python objects) and ``'capture'``
+    (executing a command and fetching its stdout). Phases after a command
+    are attributed to the verb of the last command. Text is counted in
+    bytes of its utf-8 encoding.
+    """
+
+    def __init__(self):
+        self.verbs = {}
+        self._current = None
+
+    def begin(self, cmd):
+        """Count a call of the command and make it the current one."""
+        verb = command_verb(cmd)
+        stats = self.verbs.get(verb)
+        if stats is None:
+            stats = self.verbs[verb] = VerbStats()
+        stats.calls += 1
+        self._current = stats
+        return stats
+
+    def record(self, phase, seconds, lines=0, nbytes=0):
+        """Record a phase of the current command."""
+        stats = self._current
+        if stats is None:
+            stats = self.begin('')
+        hist = stats.phases.get(phase)
+        if hist is None:
+            hist = stats.phases[phase] = Histogram()
+        hist.add(seconds)
+        stats.lines += lines
+        stats.bytes += nbytes
+
+    def record_many(self, cmds, seconds):
+        """Count multiple commands that were executed together, and split
+        the elapsed time evenly among them."""
+        if not cmds:
+            return
+        seconds /= len(cmds)
+        for cmd in cmds:
+            self.begin(cmd)
+            self.record('command', seconds)
+
+    def reset(self):
+        """Discard all statistics."""
+        self.verbs.clear()
+        self._current = None
+
+    def as_dict(self):
+        """Return the statistics as nested dictionary by verb."""
+        return {verb: stats.as_dict() for verb, stats in self.verbs.items()}
+
+    def prometheus(self, prefix='pytao'):
+        """Return the statistics in the Prometheus text exposition format."""
+        lines = []
+        verbs = sorted(self.verbs.items())
+        for name in ('calls', 'lines', 'bytes'):
+            metric = '{}_{}_total'.format(prefix, name)
+            lines.append('# TYPE {} counter'.format(metric))
+            lines.extend(
+                '{}{{verb="{}"}} {}'.format(metric, _escape(verb),
+                                            getattr(stats, name))
+                for verb, stats in verbs)
+        metric = '{}_phase_seconds'.format(prefix)
+        lines.append('# TYPE {} histogram'.format(metric))
+        for verb, stats in verbs:
+            for phase, hist in sorted(stats.phases.items()):
+                labels = 'verb="{}",phase="{}"'.format(_escape(verb), phase)
+                total = 0
+                for le, count in zip(BUCKETS + ('+Inf',), hist.counts):
+                    total += count
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                        metric, labels, le, total))
+                lines.append('{}_sum{{{}}} {!r}'.format(
+                    metric, labels, hist.sum))
+                lines.append('{}_count{{{}}} {}'.format(
+                    metric, labels, hist.count))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return (value.replace('\\', '\\\\')
+                 .replace('"', '\\"')
+                 .replace('\n', '\\n'))
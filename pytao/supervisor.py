@@ -0,0 +1,268 @@
+# encoding: utf-8
+"""
+Automatic crash recovery for long-running Tao sessions.
+
+Example:
+
+    >>> from pytao.supervisor import SupervisedTao
+
+    >>> tao = SupervisedTao('-lat', 'my_lat.bmad', checkpoint_interval=100)
+    >>> tao.command('set element q1 k1 = 0.1')
+    >>> # ... if the Tao process crashes now, it is restarted, the state is
+    >>> # restored and the failed request is retried:
+    >>> tao.properties('lat_ele1 1@0>>1|model twiss')
+    >>> tao.recovery_times
+    [0.0831]
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import logging
+import re
+from collections import OrderedDict
+from timeit import default_timer
+
+from minrpc.client import RemoteProcessCrashed
+
+from pytao.tao import Tao
+from pytao.wire import WirePipe
+
+
+__all__ = [
+    'Journal',
+    'SupervisedTao',
+]
+
+
+# Commands that don't change the state of Tao:
+READ_ONLY = ('python', 'show', 'help', 'write')
+
+# Functions that read the output of the last python command:
+SCRATCH_READS = ('scratch_n_lines', 'scratch_line', 'scratch_text',
+                 'scratch_array')
+
+# Arguments of Tao that only concern the client side:
+CLIENT_ARGS = ('cache_size', 'command_log', 'debug', 'stats')
+
+
+class Journal(object):
+
+    """
+    State-changing commands in compact form.
+
+    Read-only commands are skipped. Of multiple ``set ... = value`` or
+    ``change ... @ value`` commands for the same target without other
+    commands in between only the last one is kept, since it determines the
+    final value. Other commands, e.g. ``run`` or ``set global
+    lattice_calc_on``, may depend on the values at that time, so they end
+    the compaction. Relative changes (``change ... delta``) are always
+    kept.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._count = 0
+        # {compaction key: entry key} since the last other command:
+        self._overrides = {}
+
+    def add(self, cmd):
+        """Add a command. Returns whether it was recorded."""
+        words = cmd.split(None, 1)
+        if not words or words[0] in READ_ONLY:
+            return False
+        key = _compaction_key(words[0], cmd)
+        if key is None:
+            self._overrides.clear()
+        else:
+            previous = self._overrides.pop(key, None)
+            if previous is not None:
+                del self._entries[previous]
+            self._overrides[key] = self._count
+        self._entries[self._count] = cmd
+        self._count += 1
+        return True
+
+    def clear(self):
+        self._entries.clear()
+        self._overrides.clear()
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Separator of an absolute value in ``change``. Without it, the value is a
+# delta. Must be preceded by a space, since element names can contain '@':
+RE_CHANGE_ABSOLUTE = re.compile(r'\s@')
+
+
+def _compaction_key(verb, cmd):
+    if verb == 'set' and '=' in cmd:
+        target = cmd.split('=', 1)[0]
+        # switching it on recomputes the lattice with the current values:
+        if 'lattice_calc_on' in target.lower():
+            return None
+    elif verb == 'change':
+        parts = RE_CHANGE_ABSOLUTE.split(cmd, 1)
+        if len(parts) < 2:
+            return None     # relative changes accumulate
+        target = parts[0]
+    else:
+        return None
+    return (verb, ' '.join(target.split()))
+
+
+class SupervisedTao(Tao):
+
+    """
+    :class:`~pytao.tao.Tao` that recovers from crashes of the Tao process.
+
+    State-changing commands are journaled (see :class:`Journal`). When the
+    Tao process crashes, a new process is started, the state is restored
+    and the failed request is retried up to `max_retries` times before
+    :class:`RemoteProcessCrashed` is raised.
+
+    With `checkpoint_interval`, a dormant copy of the Tao process is forked
+    after that many journaled commands (posix only). It is used to recover
+    by replaying only the commands since the checkpoint. Otherwise, the
+    process is restarted from the initial arguments and the whole journal
+    is replayed.
+
+    The durations of all recoveries in seconds are appended to
+    :attr:`recovery_times`.
+    """
+
+    def __init__(self, *initargs, **kwargs):
+        self.max_retries = kwargs.pop('max_retries', 3)
+        self.checkpoint_interval = kwargs.pop('checkpoint_interval', None)
+        if kwargs.get('in_process'):
+            raise ValueError("Can't supervise an in-process Tao.")
+        self.journal = Journal()
+        self.recovery_times = []
+        self._initargs = initargs
+        self._spawn_args = {k: v for k, v in kwargs.items()
+                            if k not in CLIENT_ARGS}
+        self._since_checkpoint = Journal()
+        self._checkpoint = None
+        self._journaled = 0
+        self._closed = False
+        # python command whose output is in the scratch buffer:
+        self._scratch_command = None
+        super(SupervisedTao, self).__init__(*initargs, **kwargs)
+        self._worker = self.pipe
+        self.pipe = _SupervisedPipe(self)
+
+    def checkpoint(self):
+        """Fork a dormant copy of the Tao process to recover from."""
+        self._discard_checkpoint()
+        self._checkpoint = self._service.fork()
+        self._since_checkpoint.clear()
+        self._journaled = 0
+
+    def close(self):
+        """Stop the Tao process and the checkpoint process."""
+        self._closed = True
+        self._discard_checkpoint()
+        self._close_wire()
+        super(SupervisedTao, self).close()
+
+    def __bool__(self):
+        """Check if Tao has not been closed (it may be recovering)."""
+        return not self._closed
+
+    __nonzero__ = __bool__
+
+    def _call(self, funcname, args, kwargs):
+        """Call a function of the Tao process, recovering from crashes."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                # the output of a python command is lost in a crash:
+                if (attempt > 0 and funcname in SCRATCH_READS and
+                        self._scratch_command is not None):
+                    self._worker.command(self._scratch_command)
+                result = getattr(self._worker, funcname)(*args, **kwargs)
+            except RemoteProcessCrashed:
+                # can't resume an interrupted output stream:
+                if (attempt == self.max_retries or
+                        funcname in ('capture_read', 'capture_finish')):
+                    raise
+                self._recover()
+            else:
+                self._record(funcname, args)
+                return result
+
+    def _record(self, funcname, args):
+        if funcname in ('command', 'capture', 'capture_start'):
+            cmds = args[:1]
+        elif funcname == 'commands':
+            cmds = args[0]
+        else:
+            return
+        for cmd in cmds:
+            self._scratch_command = (
+                cmd if cmd.split(None, 1)[:1] == ['python'] else None)
+            if self.journal.add(cmd):
+                self._since_checkpoint.add(cmd)
+                self._journaled += 1
+        if (self.checkpoint_interval and
+                self._journaled >= self.checkpoint_interval):
+            self.checkpoint()
+
+    def _recover(self):
+        start = default_timer()
+        logging.getLogger(__name__).warn(
+            "Tao process has crashed, restarting.")
+        self._close_wire()
+        self._service.close()
+        self._process.poll()
+        restored = False
+        if self._checkpoint is not None:
+            self._service, self._process = self._checkpoint
+            self._checkpoint = None
+            self._worker = self._service.get_module('pytao.tao_pipe')
+            try:
+                self._worker.commands(list(self._since_checkpoint))
+                restored = True
+            except RemoteProcessCrashed:
+                self._service.close()
+        if not restored:
+            fresh = Tao(*self._initargs, **self._spawn_args)
+            self._service, self._process = fresh._service, fresh._process
+            self._worker = fresh.pipe
+            self._worker.commands(list(self.journal))
+        self._since_checkpoint.clear()
+        self._journaled = 0
+        self.invalidate()
+        if self.checkpoint_interval:
+            self.checkpoint()
+        self.recovery_times.append(default_timer() - start)
+
+    def _close_wire(self):
+        # A checkpoint is restored with the default protocol:
+        if isinstance(self._worker, WirePipe):
+            self._worker.close()
+
+    def _discard_checkpoint(self):
+        if self._checkpoint is not None:
+            client, process = self._checkpoint
+            self._checkpoint = None
+            client.close()
+
+
+class _SupervisedPipe(object):
+
+    """Proxy for the functions of the Tao process that forwards calls to
+    :meth:`SupervisedTao._call`."""
+
+    def __init__(self, tao):
+        self._tao = tao
+
+    def __getattr__(self, funcname):
+        tao = self._tao
+        def call(*args, **kwargs):
+            return tao._call(funcname, args, kwargs)
+        setattr(self, funcname, call)
+        return call
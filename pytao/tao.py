@@ -18,11 +18,19 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 
+import atexit
+import codecs
+import gzip
 import os
 import re
 import sys
 import logging
+import threading
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from operator import itemgetter
+from timeit import default_timer
 
 # dictionary type that preserves insertion order if not deleting an element.
 # (this is technically just an implementation detail of CPython 3.6)
@@ -34,7 +42,13 @@ else:
 import numpy as np
 
 from minrpc.util import ChangeDirectory
-from minrpc.client import Client, RemoteProcessCrashed, RemoteProcessClosed
+from minrpc.client import RemoteProcessCrashed, RemoteProcessClosed
+
+from pytao import wire
+from pytao.cache import ResultCache
+from pytao.service import Client
+from pytao.stats import CommandStats
+from pytao.transport import SHM_THRESHOLD, export, receive
 
 try:
     basestring
@@ -44,6 +58,9 @@ except NameError:
 
 __all__ = [
     'Tao',
+    'CommandLog',
+    'BufferedCommandLog',
+    'TaoTemplate',
     'RemoteProcessCrashed',
     'RemoteProcessClosed',
 ]
@@ -60,7 +77,13 @@ PARAM_PLACE = {
 Parameter = namedtuple('Parameter', ['name', 'value', 'vary'])
 
 
-# TODO: close command log when Tao process is stopped
+# Rows of the particle arrays returned by `Tao.get_beam`:
+BEAM_COLUMNS = ('x', 'px', 'y', 'py', 'z', 'pz', 'charge', 'state')
+
+# Particle state of live particles in Bmad:
+ALIVE = 1
+
+
 class CommandLog(object):
 
     """Log command history to a text file."""
@@ -68,19 +91,164 @@ class CommandLog(object):
     @classmethod
     def create(cls, filename, prefix='', suffix='\n'):
         """Create CommandLog from filename (overwrite/create)."""
-        return cls(open(filename, 'wt'), prefix=prefix, suffix=suffix)
+        log = cls(open(filename, 'wt'), prefix=prefix, suffix=suffix)
+        log._owns_file = True
+        return log
 
     def __init__(self, file, prefix='', suffix='\n'):
         """Create CommandLog from file instance."""
         self._file = file
         self._prefix = prefix
         self._suffix = suffix
+        self._owns_file = False
 
     def __call__(self, command):
         """Log a single history line and flush to file immediately."""
         self._file.write(self._prefix + command + self._suffix)
         self._file.flush()
 
+    def flush(self):
+        """Flush the file."""
+        self._file.flush()
+
+    def close(self):
+        """Flush the file and close it if it was opened by :meth:`create`."""
+        if self._owns_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+class BufferedCommandLog(object):
+
+    """
+    Log command history to a file from a background thread.
+
+    Calls only append the line to a buffer. The buffer is written when it
+    exceeds `buffer_size` bytes, every `flush_interval` seconds, and on
+    :meth:`flush`, :meth:`close` and interpreter exit.
+
+    :param str filename: log file (overwrite/create)
+    :param bool compress: write gzip compressed output
+    :param int max_bytes: start a new file when this many (uncompressed)
+                          bytes have been written to the current one
+    :param int backups: number of rotated files ``filename.1``, ... to keep
+    """
+
+    def __init__(self, filename, prefix='', suffix='\n', compress=False,
+                 max_bytes=None, backups=0, buffer_size=1 << 16,
+                 flush_interval=1.0):
+        self.filename = filename
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._prefix = prefix
+        self._suffix = suffix
+        self._file = self._open()
+        self._file_size = 0
+        self._error = None
+        self._pending = []
+        self._pending_size = 0
+        self._queued = 0
+        self._written = 0
+        self._flush_target = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __call__(self, command):
+        """Queue a single history line."""
+        line = self._prefix + command + self._suffix
+        with self._cond:
+            if self._closed:
+                raise ValueError("Command log is closed.")
+            self._pending.append(line)
+            self._pending_size += len(line)
+            self._queued += 1
+            if self._pending_size >= self.buffer_size:
+                self._cond.notify()
+
+    def flush(self):
+        """Wait until all queued lines have been written."""
+        with self._cond:
+            target = self._flush_target = self._queued
+            self._cond.notify_all()
+            while self._written < target and self._thread.is_alive():
+                self._cond.wait()
+        self._check_error()
+
+    def close(self):
+        """Write all queued lines, close the file and stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._check_error()
+
+    def _check_error(self):
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _open(self):
+        if self.compress:
+            return gzip.open(self.filename, 'wb')
+        return open(self.filename, 'wb')
+
+    def _run(self):
+        cond = self._cond
+        closed = False
+        while not closed:
+            with cond:
+                if (not self._closed and
+                        self._pending_size < self.buffer_size and
+                        self._written >= self._flush_target):
+                    cond.wait(self.flush_interval)
+                lines, self._pending = self._pending, []
+                self._pending_size = 0
+                closed = self._closed
+            if lines:
+                try:
+                    self._write(''.join(lines).encode('utf-8'))
+                except Exception as e:
+                    self._error = e
+            with cond:
+                self._written += len(lines)
+                cond.notify_all()
+        self._file.close()
+
+    def _write(self, data):
+        self._file.write(data)
+        self._file.flush()
+        self._file_size += len(data)
+        if self.max_bytes and self._file_size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = '{}.{}'.format(self.filename, i)
+            if os.path.exists(src):
+                os.rename(src, '{}.{}'.format(self.filename, i + 1))
+        if self.backups > 0:
+            os.rename(self.filename, self.filename + '.1')
+        self._file = self._open()
+        self._file_size = 0
+
+
+class CommandBatch(object):
+
+    """Commands queued by :meth:`Tao.batch` and their status codes."""
+
+    def __init__(self):
+        self.pending = []
+        self.status = []
+
 
 def format_val(value):
     if isinstance(value, float):
@@ -126,22 +294,98 @@ class Tao(object):
 
             >>> tao = Tao("-lat girder.lat")
             >>> tao = Tao("-lat", "girder.lat")
+
+        With ``in_process=True``, the tao library is loaded into the current
+        process instead of a subprocess. This saves the cost of the RPC on
+        every call, but a crash in tao takes down the python process, and
+        only one such instance can exist at a time.
+
+        With ``cache_size=N``, the results of up to N python queries are
+        cached, see :meth:`Tao.cache_info`.
+
+        With ``command_log=filename``, all commands are logged to the file,
+        which is closed by :meth:`Tao.close`. Any callable can be passed
+        instead, e.g. a :class:`BufferedCommandLog` to log without blocking.
+
+        With ``stats=True``, call counts, latencies and payload sizes are
+        recorded per command in :attr:`Tao.stats`, see :class:`CommandStats`.
+
+        Results and arguments larger than ``shm_threshold`` bytes are
+        exchanged with the Tao process via shared memory instead of the
+        pipe, see :mod:`pytao.transport`. ``None`` disables this.
+
+        With ``template=TaoTemplate(...)``, the Tao process is forked from
+        an already initialized template process, see :class:`TaoTemplate`.
+
+        With ``protocol='binary'``, commands and python command outputs are
+        exchanged with the Tao process using the faster binary protocol of
+        :mod:`pytao.wire` (posix only, otherwise the default ``'pickle'``
+        protocol is used).
         """
+        in_process = Popen_args.pop('in_process', False)
+        template = Popen_args.pop('template', None)
+        protocol = Popen_args.pop('protocol', 'pickle')
+        cache_size = Popen_args.pop('cache_size', 0)
+        shm_threshold = Popen_args.pop('shm_threshold', SHM_THRESHOLD)
+        stats = Popen_args.pop('stats', False)
         self.debug = Popen_args.pop('debug', False)
         command_log = Popen_args.pop('command_log', None)
-        if isinstance(command_log, basestring):
+        self._owns_command_log = isinstance(command_log, basestring)
+        if self._owns_command_log:
             command_log = CommandLog.create(command_log)
         self.command_log = command_log
-        # stdin=None leads to an error on windows when STDIN is broken.
-        # Therefore, we need set stdin=os.devnull by passing stdin=False:
-        Popen_args.setdefault('stdin', False)
-        Popen_args.setdefault('bufsize', 0)
-        self._service, self._process = \
-            Client.spawn_subprocess(**Popen_args)
-        self.pipe = self._service.get_module('pytao.tao_pipe')
-        self.pipe.set_init_args(join_args(initargs))
-        self.set('global', lattice_calc_on='F')
-        self.command('place * none')
+        self._schemas = {}
+        self._batch = None
+        self._cache = ResultCache(cache_size) if cache_size else None
+        # incremented by every command that may change the state:
+        self.generation = 0
+        self._lattice = None
+        # {key: column} for response_matrix, valid for one generation:
+        self._response_columns = {}
+        self._response_generation = None
+        self.stats = CommandStats() if stats else None
+        # {name: (digest, generation, data)} for changed_curves:
+        self._curves = {}
+        self._curve_generation = 0
+        if template is not None and (in_process or initargs):
+            raise ValueError(
+                "Can't pass initargs or in_process with a template.")
+        if protocol not in ('pickle', 'binary'):
+            raise ValueError("Unknown protocol: {!r}".format(protocol))
+        if in_process:
+            self._service = self._process = None
+            self._shm_threshold = None
+            self.pipe = _acquire_local_pipe(self)
+        else:
+            if template is not None:
+                self._service, self._process = template._fork()
+            else:
+                # stdin=None leads to an error on windows when STDIN is
+                # broken. Therefore, we need set stdin=os.devnull by passing
+                # stdin=False:
+                Popen_args.setdefault('stdin', False)
+                Popen_args.setdefault('bufsize', 0)
+                self._service, self._process = \
+                    Client.spawn_subprocess(**Popen_args)
+            self.pipe = self._service.get_module('pytao.tao_pipe')
+            self._shm_threshold = shm_threshold
+            self.pipe.set_shm_threshold(shm_threshold)
+            if protocol == 'binary':
+                if hasattr(os, 'mkfifo'):
+                    self.pipe = wire.connect(self._service, self.pipe)
+                else:
+                    logging.getLogger(__name__).warn(
+                        "Binary protocol is not supported on this platform.")
+        if template is None:
+            try:
+                self.pipe.set_init_args(join_args(initargs))
+                self.set('global', lattice_calc_on='F')
+                self.command('place * none')
+            except BaseException:
+                # allow another in-process instance:
+                if in_process:
+                    _release_local_pipe(self)
+                raise
 
     # generic functions to access tao, please use these:
 
@@ -165,14 +409,154 @@ class Tao(object):
             >>> tao.command("set", "element", "bb", "k1", "=", 1)
         """
         cmd = join_args(command)
-        self._log_command(cmd)
-        self.pipe.command(cmd)
+        if self._batch is not None:
+            self._log_command(cmd)
+            self._invalidate_for(cmd)
+            # counted when the batch is sent:
+            self._batch.pending.append(cmd)
+        else:
+            self._command(cmd)
+
+    def command_many(self, commands):
+        """
+        Send multiple commands to tao in a single call and return the list of
+        status codes.
+
+        Each command can be either a string or a tuple of arguments that is
+        concatenated as in :meth:`Tao.command`:
+
+            >>> tao.command_many([
+            ...     "set element q1 k1 = 0.1",
+            ...     ("set", "element", "q2", "k1", "=", 0.2),
+            ... ])
+            [0, 0]
+
+        Inside a :meth:`Tao.batch` block the commands are queued and
+        ``None`` is returned.
+        """
+        cmds = [c if isinstance(c, basestring) else join_args(c)
+                for c in commands]
+        for cmd in cmds:
+            self._log_command(cmd)
+            self._invalidate_for(cmd)
+        if self._batch is not None:
+            self._batch.pending.extend(cmds)
+            return None
+        if self.stats is None:
+            return self.pipe.commands(cmds)
+        start = default_timer()
+        status = self.pipe.commands(cmds)
+        self.stats.record_many(cmds, default_timer() - start)
+        return status
+
+    @contextmanager
+    def batch(self):
+        """
+        Queue all commands issued within the block and send them in a single
+        call when leaving the block. Returns a context manager.
+
+            >>> with tao.batch() as batch:
+            ...     tao.command("set element q1 k1 = 0.1")
+            ...     tao.command("set element q2 k1 = 0.2")
+            >>> batch.status
+            [0, 0]
+
+        Methods that return output (e.g. :meth:`Tao.python`) send the queued
+        commands before their own. Nested blocks are merged into the
+        outermost one.
+        """
+        if self._batch is not None:
+            yield self._batch
+            return
+        self._batch = batch = CommandBatch()
+        try:
+            yield batch
+        finally:
+            try:
+                self._flush_batch()
+            finally:
+                self._batch = None
 
     def capture(self, *command):
         """Send a command to Tao and returns the output string."""
         cmd = join_args(command)
         self._log_command(cmd)
-        return self.pipe.capture(cmd)
+        self.invalidate()
+        self._flush_batch()
+        stats = self.stats
+        if stats is None:
+            return self.pipe.capture(cmd)
+        stats.begin(cmd)
+        start = default_timer()
+        output = self.pipe.capture(cmd)
+        stats.record('capture', default_timer() - start,
+                     output.count('\n'), _utf8_size(output))
+        return output
+
+    def capture_iter(self, *command):
+        """
+        Send a command to Tao and iterate over the lines of its output
+        (without line terminator) while the command is still running.
+
+            >>> for line in tao.capture_iter('show lattice -all'):
+            ...     if 'QUAD' in line:
+            ...         print(line)
+
+        Only constant memory is needed on both sides, independent of the
+        output size (except with ``in_process=True``, where the output is
+        captured as a whole before iterating). No other commands may be sent
+        to Tao before the iteration has finished or the iterator has been
+        closed.
+        """
+        cmd = join_args(command)
+        self._log_command(cmd)
+        self.invalidate()
+        self._flush_batch()
+        stats = self.stats
+        if stats is not None:
+            stats.begin(cmd)
+        start = default_timer()
+        if self._service is None:
+            # Can't stream in-process, since the stdout of the consumer is
+            # redirected as well while the command is running:
+            output = self.pipe.capture(cmd)
+            if stats is not None:
+                stats.record('capture', default_timer() - start,
+                             output.count('\n'), _utf8_size(output))
+            lines = output.split('\n')
+            if lines[-1] == '':
+                lines.pop()
+            for line in lines:
+                yield line
+            return
+        self.pipe.capture_start(cmd)
+        # time spent waiting for Tao, excluding the consumer:
+        elapsed = default_timer() - start
+        nlines = nbytes = 0
+        try:
+            decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            partial = ''
+            while True:
+                start = default_timer()
+                chunk = self.pipe.capture_read()
+                elapsed += default_timer() - start
+                nlines += chunk.count(b'\n')
+                nbytes += len(chunk)
+                text = partial + decoder.decode(chunk, not chunk)
+                lines = text.split('\n')
+                partial = lines.pop()
+                for line in lines:
+                    yield line
+                if not chunk:
+                    break
+            if partial:
+                yield partial
+        finally:
+            start = default_timer()
+            self.pipe.capture_finish()
+            if stats is not None:
+                stats.record('capture', elapsed + default_timer() - start,
+                             nlines, nbytes)
 
     def python(self, *command):
         """
@@ -198,11 +582,21 @@ class Tao(object):
         For many python commands, it may be more convenient to use
         :meth:`Tao.get_list` or :meth:`Tao.properties` instead.
         """
-        self.command('python', '-noprint', *command)
-        return [
-            self.pipe.scratch_line(n+1).split(';')
-            for n in range(self.pipe.scratch_n_lines())
-        ]
+        return self._cached('python', command, lambda: self._python(*command))
+
+    def _python(self, *command):
+        self._python_command(*command)
+        # Fetch the whole scratch buffer in a single round trip rather than
+        # requesting each line separately:
+        stats = self.stats
+        if stats is None:
+            return _split_rows(receive(self.pipe.scratch_text()))
+        start = default_timer()
+        text = receive(self.pipe.scratch_text())
+        rows = _split_rows(text)
+        stats.record('scratch', default_timer() - start,
+                     len(rows), _utf8_size(text))
+        return rows
 
     # Convenience methods for getting info from python commands:
 
@@ -241,7 +635,8 @@ class Tao(object):
         :meth:`Tao.properties` but returns a dictionary of :class:`Parameter`
         instead - which knows about the `vary` flag.)
         """
-        return self._parse_dict(self.python(*qualname))
+        return self._cached('properties', qualname, lambda:
+                            self._parse_dict(self._python(*qualname)))
 
     def parameters(self, *qualname):
         """
@@ -256,7 +651,8 @@ class Tao(object):
             >>> param['beta_a'].vary
             True
         """
-        return self._parse_param_dict(self.python(*qualname))
+        return self._cached('parameters', qualname, lambda:
+                            self._parse_param_dict(self._python(*qualname)))
 
     # specialized commands:
 
@@ -270,8 +666,9 @@ class Tao(object):
         """
         # Note, that the tao_pipe module includes the functions 'getcwd' and
         # 'chdir' so it can be used as a valid 'os' module for the purposes
-        # of ChangeDirectory:
-        return ChangeDirectory(path, self.pipe)
+        # of ChangeDirectory. Queued commands are sent before changing the
+        # directory:
+        return ChangeDirectory(path, _BatchedDirectory(self))
 
     def read(self, filename, chdir=False):
         """
@@ -299,42 +696,132 @@ class Tao(object):
         """Return names of available plots."""
         return self.get_list('plot_list', 't')  # t = templates
 
+    def plot_tree(self, plots=None, data=False):
+        """
+        Get the properties of plots, their graphs and curves in a single
+        call. Returns a list with one dict per plot:
+
+            >>> tao.plot_tree(['beta'], data=True)
+            [{'name': 'beta',
+              'properties': {...},
+              'graphs': [{'name': 'g',
+                          'path': 'beta.g',
+                          'properties': {...},
+                          'curves': [{'name': 'a',
+                                      'path': 'beta.g.a',
+                                      'properties': {...},
+                                      'data': array(...)},
+                                     ...]}]}]
+
+        The properties are the results of the ``plot1``, ``plot_graph`` and
+        ``plot_curve`` python commands. Curve ``data`` (as returned by
+        :meth:`curve_data`) is only included if `data` is true. If `plots` is
+        ``None``, all plot templates are included.
+        """
+        plots = None if plots is None else list(plots)
+        return self._cached('plot_tree', (plots, data), lambda:
+                            self._fetch_plot_tree(plots, data))
+
+    def _fetch_plot_tree(self, plots, data):
+        self._flush_batch()
+        parse = self._parse_dict
+        return [{
+            'name': plot,
+            'properties': parse(_split_rows(receive(plot_text))),
+            'graphs': [{
+                'name': graph,
+                'path': plot + '.' + graph,
+                'properties': parse(_split_rows(receive(graph_text))),
+                'curves': [{
+                    'name': curve,
+                    'path': plot + '.' + graph + '.' + curve,
+                    'properties': parse(_split_rows(receive(curve_text))),
+                    'data': _curve_from_buffer(curve_data),
+                } for curve, curve_text, curve_data in curves],
+            } for graph, graph_text, curves in graphs],
+        } for plot, plot_text, graphs in self.pipe.plot_tree(plots, data)]
+
     def valid_graphs(self):
         return [
-            (graph_path, {'plot': plot_info,
-                          'graph': graph_info})
-            for plot_name  in self.plots()
-            for plot_info  in [self.properties('plot1', plot_name)]
-            for graph_name in plot_info.get('graph', [])
-            for graph_path in [plot_name + '.' + graph_name]
-            for graph_info in [self.properties('plot_graph', graph_path)]
-            if graph_info.get('curve', [])
-            # if  graph_info.get('valid')
+            (graph['path'], {'plot': plot['properties'],
+                             'graph': graph['properties']})
+            for plot in self.plot_tree()
+            for graph in plot['graphs']
+            if graph['properties'].get('curve', [])
+            # if  graph['properties'].get('valid')
         ]
 
     def curve_data(self, name):
         """Get a numpy array of (x,y) value pairs for the specified curve."""
-        return _parse_curve(self.python('plot_line', name))
+        return self._python_array((0, 3), 'plot_line', name)[:,1:]
+
+    def changed_curves(self, names=None, since=0):
+        """
+        Get the data of all curves that have changed since the state
+        identified by the token `since`. Returns ``(token, curves)``, where
+        ``curves`` is a dictionary of the changed curve arrays (as returned
+        by :meth:`curve_data`) and ``token`` identifies the current state:
+
+            >>> token, curves = tao.changed_curves(['beta.g.a', 'beta.g.b'])
+            >>> tao.change('element', 'qp1', k1=0.2)
+            >>> tao.update()
+            >>> token, curves = tao.changed_curves(since=token)
+
+        Changes are detected by comparing a content digest computed in the
+        Tao process, so only the changed curves are transferred. If `names`
+        is ``None``, all curves that have been requested before are checked.
+        """
+        names = list(self._curves) if names is None else list(names)
+        known = {name: self._curves[name][0]
+                 for name in names if name in self._curves}
+        self._flush_batch()
+        changes = self.pipe.curve_changes(names, known)
+        if changes:
+            self._curve_generation += 1
+            for name, (digest, data) in changes.items():
+                self._curves[name] = (digest, self._curve_generation,
+                                      _curve_from_buffer(data))
+        return self._curve_generation, OrderedDict([
+            (name, self._curves[name][2])
+            for name in names
+            if self._curves[name][1] > since
+        ])
 
     def curve_names(self, plot):
         """Get the plot specific curve names."""
-        props = self.properties
         return [
-            plot+'.'+graph+'.'+curve
-            for graph in props('plot1', plot).get('graph', [])
-            for curve in props('plot_graph', plot+'.'+graph).get('curve', [])
+            curve['path']
+            for tree in self.plot_tree([plot])
+            for graph in tree['graphs']
+            for curve in graph['curves']
         ]
 
     def plot_data(self, plot):
-        return [(self.properties('plot_graph', curve_name),
-                 self.properties('plot_curve', curve_name),
-                 self.curve_data(curve_name))
-                for curve_name in self.curve_names(plot)]
+        return [(graph['properties'],
+                 curve['properties'],
+                 curve['data'])
+                for tree in self.plot_tree([plot], data=True)
+                for graph in tree['graphs']
+                for curve in graph['curves']]
 
         #color = curve_props['line%color']
         #xlabel = graph_props['x%label']
         #ylabel = graph_props['y%label']
 
+    @property
+    def lattice(self):
+        """
+        Lazy view of the lattice elements, see :class:`~pytao.lattice.Lattice`:
+
+            >>> ring = tao.lattice[0]
+            >>> ring[10].twiss['beta_a']
+            >>> ring['Q1'].general['l']
+        """
+        if self._lattice is None:
+            from pytao.lattice import Lattice
+            self._lattice = Lattice(self)
+        return self._lattice
+
     def get_element_data(self, ix_ele, which='model', who='general',
                          universe=1, branch=0):
         return self.properties('lat_ele1 {}@{}>>{}|{} {}'.format(
@@ -342,27 +829,331 @@ class Tao(object):
         ))
 
     def get_element_floor(self, ix_ele, which='model', universe=1, branch=0):
-        return _parse_array(self.python('lat_ele1 {}@{}>>{}|{} {}'.format(
+        return self._python_array((0, 0), 'lat_ele1 {}@{}>>{}|{} {}'.format(
             universe, branch, ix_ele, which, 'floor'
-        )))
+        ))
+
+    def lattice_table(self, names, universe=1, branch=0, which='model',
+                      groups=('general', 'twiss', 'orbit')):
+        """
+        Get numeric attributes of all elements in a lattice branch as
+        dictionary of float64 arrays:
+
+            >>> table = tao.lattice_table(['s', 'beta_a', 'alpha_a'])
+            >>> table['beta_a']
+            array([44.        , 56.        , ...])
+
+        The table is assembled inside the Tao process and transferred in a
+        single call. Only the ``lat_ele1`` attribute groups that contain the
+        requested names are queried. Attributes that are not available for
+        an element are NaN. Raises :class:`ValueError` for names that are not
+        in any of the groups for the first element.
+        """
+        names = [name.lower() for name in names]
+        self._flush_batch()
+        nrows, data = self.pipe.lattice_table(
+            '{}@{}'.format(universe, branch), which, names, list(groups))
+        columns = np.frombuffer(receive(data), dtype=np.float64).reshape(
+            len(names), nrows)
+        return OrderedDict(zip(names, columns))
+
+    def scan(self, variables, observe, universe=1, branch=0, which='model',
+             batch_size=None, groups=('general', 'parameters', 'twiss',
+                                      'orbit')):
+        """
+        Evaluate element attributes for a sequence of variable settings:
+
+            >>> tao.scan({'Q1[k1]': [0.1, 0.2, 0.3],
+            ...           'Q2[k1]': [-0.1, -0.2, -0.3]},
+            ...          observe=['END[beta_a]', 'END[beta_b]'])
+            array([[12.1, 30.4],
+                   [14.5, 28.2],
+                   [17.3, 25.9]])
+
+        :param dict variables: value sequences of equal length for element
+                               attributes ``'ELEMENT[attribute]'``
+        :param list observe: element attributes ``'ELEMENT[attribute]'``
+        :param str which: only ``'model'`` is supported, since the other
+                          lattices can't be changed
+        :param int batch_size: number of points per call to Tao
+        :param tuple groups: ``lat_ele1`` attribute groups to search for
+                             the attribute names
+
+        Returns an array with one row of observable values per point.
+        Values that are not available are NaN.
+
+        For each point, the variables are set and the lattice is recomputed
+        once. The loop runs in the Tao process, and only the groups that
+        contain the observed attributes are read, so there is only one
+        round trip per batch. The variables are restored afterwards.
+        """
+        _check_variable_lattice(which)
+        names = list(variables)
+        location = (universe, branch, which)
+        points = np.column_stack([
+            np.asarray(variables[name], dtype=float).ravel()
+            for name in names]) if names else np.empty((0, 0))
+        try:
+            return self._scan(_setters(names, *location),
+                              _observables(observe, *location),
+                              points, groups, batch_size)
+        finally:
+            # the lattice was recomputed with the restored values:
+            self.invalidate()
+
+    def response_matrix(self, variables, observe, step=1e-6,
+                        method='forward', processes=1, universe=1,
+                        branch=0, which='model',
+                        groups=('general', 'parameters', 'twiss', 'orbit')):
+        """
+        Compute the derivatives of element attributes with respect to other
+        element attributes by finite differences:
+
+            >>> tao.response_matrix(['Q1[k1]', 'Q2[k1]'],
+            ...                     ['BPM1[orbit_x]', 'BPM2[orbit_x]'],
+            ...                     step=1e-5, method='central')
+            array([[ 0.12, -0.03],
+                   [ 0.41,  0.27]])
+
+        :param list variables: element attributes ``'ELEMENT[attribute]'``
+        :param list observe: element attributes ``'ELEMENT[attribute]'``
+        :param step: perturbation, scalar or one value per variable
+        :param str method: ``'forward'`` or ``'central'`` differences
+        :param str which: only ``'model'`` is supported, see :meth:`scan`
+        :param int processes: number of processes to distribute the
+                              perturbed points over. The additional
+                              processes are forked from the Tao process and
+                              therefore start with the same state (posix
+                              only).
+
+        Returns an array of shape ``(len(observe), len(variables))``.
+
+        The perturbed points are evaluated using :meth:`scan`. Columns are
+        cached until the next command that may change the state of Tao (see
+        :attr:`generation`), so that repeated calls at the same operating
+        point return without contacting Tao.
+        """
+        if method not in ('forward', 'central'):
+            raise ValueError("Unknown method: {!r}".format(method))
+        _check_variable_lattice(which)
+        variables = list(variables)
+        observe = list(observe)
+        steps = np.broadcast_to(np.asarray(step, dtype=float),
+                                (len(variables),))
+        if np.any(steps == 0):
+            raise ValueError("Step must be non-zero.")
+        location = (universe, branch, which)
+        if self._response_generation != self.generation:
+            self._response_generation = self.generation
+            self._response_columns.clear()
+        cache = self._response_columns
+        keys = [(location, tuple(groups), name, h, method, tuple(observe))
+                for name, h in zip(variables, steps)]
+        result = np.empty((len(observe), len(variables)))
+        missing = []
+        for j, key in enumerate(keys):
+            column = cache.get(key)
+            if column is None:
+                missing.append(j)
+            else:
+                result[:, j] = column
+        if not missing:
+            return result
+        names = [variables[j] for j in missing]
+        setters = _setters(names, *location)
+        observables = _observables(observe, *location)
+        try:
+            x0 = self._scan([], [(element, attr)
+                                 for _, element, attr in setters],
+                            np.empty((1, 0)), groups)[0]
+            if np.any(np.isnan(x0)):
+                raise ValueError("Unknown attribute: {}".format(
+                    names[int(np.argmax(np.isnan(x0)))]))
+            h = steps[missing]
+            shifts = np.diag(h)
+            if method == 'forward':
+                points = x0 + np.vstack([np.zeros((1, len(h))), shifts])
+            else:
+                points = x0 + np.vstack([shifts, -shifts])
+            values = self._scan_parallel(
+                setters, observables, points, groups, processes)
+        finally:
+            # the lattice was recomputed with the restored values, which
+            # doesn't affect the response columns:
+            self.invalidate()
+            self._response_generation = self.generation
+        if method == 'forward':
+            columns = (values[1:] - values[0]) / h[:, None]
+        else:
+            n = len(h)
+            columns = (values[:n] - values[n:]) / (2 * h[:, None])
+        for j, column in zip(missing, columns):
+            result[:, j] = cache[keys[j]] = column
+        return result
+
+    def _scan(self, setters, observables, points, groups, batch_size=None):
+        """Evaluate `observables` at `points` in the Tao process, see
+        :meth:`scan`."""
+        npoints = len(points)
+        batch_size = batch_size or max(npoints, 1)
+        self._flush_batch()
+        stats = self.stats
+        if stats is not None:
+            stats.begin('scan')
+            start = default_timer()
+        result = np.empty((npoints, len(observables)))
+        for i in range(0, npoints, batch_size):
+            batch = points[i:i+batch_size]
+            n, data = self.pipe.scan(
+                setters, batch.tolist(), observables, list(groups))
+            result[i:i+n] = np.frombuffer(
+                receive(data), dtype=np.float64).reshape(n, len(observables))
+        if stats is not None:
+            stats.record('command', default_timer() - start,
+                         npoints, result.nbytes)
+        return result
+
+    def _scan_parallel(self, setters, observables, points, groups,
+                       processes):
+        """Like :meth:`_scan`, but distribute the points over this and
+        ``processes-1`` forked Tao processes."""
+        chunks = np.array_split(points, max(min(processes, len(points)), 1))
+        if len(chunks) == 1:
+            return self._scan(setters, observables, points, groups)
+        workers = []
+        try:
+            for _ in chunks[1:]:
+                workers.append(Tao(template=self))
+            with ThreadPoolExecutor(len(workers)) as executor:
+                futures = [
+                    executor.submit(worker._scan, setters, observables,
+                                    chunk, groups)
+                    for worker, chunk in zip(workers, chunks[1:])
+                ]
+                results = [self._scan(setters, observables, chunks[0],
+                                      groups)]
+                results.extend(future.result() for future in futures)
+        finally:
+            for worker in workers:
+                worker.close()
+        return np.vstack(results)
+
+    def get_beam(self, ele, universe=1, branch=0, ix_bunch=1):
+        """
+        Get the particle distribution of a bunch at an element as float64
+        array of shape ``(8, N)`` with the rows given by ``BEAM_COLUMNS``,
+        i.e. the Bmad phase space coordinates followed by charge and state:
+
+            >>> beam = tao.get_beam('end')
+            >>> x, px = beam[0], beam[1]
+
+        The beam must have been saved at the element during beam tracking,
+        otherwise :class:`RuntimeError` is raised. The particles are parsed
+        in the Tao process and transferred as a single binary buffer.
+        """
+        self._flush_batch()
+        n, data = self.pipe.get_beam(
+            '{}@{}>>{}'.format(universe, branch, ele), ix_bunch)
+        return np.frombuffer(receive(data), dtype=np.float64).reshape(
+            len(BEAM_COLUMNS), n)
+
+    def set_beam(self, beam, species, charge=0.0):
+        """
+        Set the initial particle distribution for beam tracking.
+
+        :param beam: array of shape ``(8, N)`` as returned by
+                     :meth:`get_beam`, or ``(6, N)`` with only the phase
+                     space coordinates
+        :param str species: particle species, e.g. ``'electron'``
+        :param float charge: total bunch charge, distributed equally among
+                             the particles if `beam` has no charge row
+
+        The distribution is passed to Tao as ``beam_init%position_file``.
+        """
+        beam = np.asarray(beam, dtype=np.float64)
+        if beam.ndim != 2 or beam.shape[0] not in (6, len(BEAM_COLUMNS)):
+            raise ValueError("Expected array of shape (6, N) or (8, N), "
+                             "got {}".format(beam.shape))
+        n = beam.shape[1]
+        if beam.shape[0] == 6:
+            full = np.empty((len(BEAM_COLUMNS), n))
+            full[:6] = beam
+            full[6] = charge / n if n else 0.0
+            full[7] = ALIVE
+            beam = full
+        data = np.ascontiguousarray(beam).ravel()
+        filename = self.pipe.write_beam(
+            export(data, self._shm_threshold), n, species)
+        self.command('set beam_init position_file =', filename)
 
     def get_lattice_elements(self, name):
         pass
 
     def change(self, *what, **data):
-        for k, v in data.items():
-            self.command('change', join_args(what), k, '@', v)
+        self.command_many([
+            ('change', join_args(what), k, '@', v)
+            for k, v in data.items()
+        ])
 
     def set(self, *what, **data):
-        for k, v in data.items():
-            self.command('set', join_args(what), k, '=', v)
+        self.command_many([
+            ('set', join_args(what), k, '=', v)
+            for k, v in data.items()
+        ])
 
     def set_param(self, kind, **kwargs):
         self.change(PARAM_PLACE[kind], **kwargs)
 
+    def invalidate(self):
+        """Clear the cached results of python queries and the element data
+        memoized by :attr:`lattice`."""
+        self.generation += 1
+        if self._cache is not None:
+            self._cache.clear()
+
+    def cache_info(self):
+        """
+        Return hit/miss statistics of the query cache as
+        :class:`~pytao.cache.CacheInfo` (or ``None`` if caching is disabled).
+
+        The cache is enabled by passing ``cache_size`` to :class:`Tao`. It
+        stores the results of :meth:`python`, :meth:`properties`,
+        :meth:`parameters` and the array queries (:meth:`curve_data`, ...),
+        keyed on the python command. The cache is cleared by every command
+        that is not a python command (including :meth:`set`,
+        :meth:`change`, :meth:`read`, :meth:`update` and :meth:`capture`).
+        Cached results are shared between calls and must not be modified.
+        """
+        if self._cache is not None:
+            return self._cache.info()
+
+    def close(self):
+        """Stop the Tao process and close or flush the command log."""
+        if self._service is None:
+            _release_local_pipe(self)
+            self.pipe = None
+        else:
+            if isinstance(self.pipe, wire.WirePipe):
+                self.pipe.close()
+            self._service.close()
+            self._process.wait()
+        log = self.command_log
+        if self._owns_command_log:
+            log.close()
+        elif hasattr(log, 'flush'):
+            log.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def __bool__(self):
-        """Check if MAD-X is up and running."""
-        return bool(self.pipe)
+        """Check if Tao is up and running."""
+        if self._service is None:
+            return self.pipe is not None
+        return bool(self._service)
 
     __nonzero__ = __bool__      # alias for python2 compatibility
 
@@ -376,6 +1167,92 @@ class Tao(object):
         if self.debug:
             print("tao: " + command)
 
+    def _cached(self, kind, command, fetch):
+        """Return ``fetch()``, using the query cache if enabled."""
+        if self._cache is None:
+            return fetch()
+        return self._cache.get((kind, join_args(command)), fetch)
+
+    def _invalidate_for(self, command):
+        """Invalidate cached results if `command` may change the state."""
+        if not command.startswith('python'):
+            self.invalidate()
+
+    def _python_many(self, commands):
+        """Execute multiple python commands in a single call and return
+        their outputs as in :meth:`python` (without caching)."""
+        commands = list(commands)
+        self._flush_batch()
+        if self.stats is None:
+            outputs = self.pipe.python_many(commands)
+        else:
+            start = default_timer()
+            outputs = self.pipe.python_many(commands)
+            self.stats.record_many(['python ' + cmd for cmd in commands],
+                                   default_timer() - start)
+        return [_split_rows(receive(text)) for text in outputs]
+
+    def _command(self, cmd):
+        """Send a command to tao immediately."""
+        self._log_command(cmd)
+        self._invalidate_for(cmd)
+        stats = self.stats
+        if stats is None:
+            self.pipe.command(cmd)
+        else:
+            stats.begin(cmd)
+            start = default_timer()
+            self.pipe.command(cmd)
+            stats.record('command', default_timer() - start)
+
+    def _python_command(self, *command):
+        """Execute a python command, leaving the output in the scratch
+        buffer. Queued commands are sent first, but the status of the python
+        command is not added to the batch."""
+        self._flush_batch()
+        self._command(join_args(('python', '-noprint') + command))
+
+    def _fork(self):
+        """Fork the Tao process, see :class:`TaoTemplate`."""
+        if self._service is None:
+            raise ValueError("Can't fork an in-process Tao.")
+        self._flush_batch()
+        return self._service.fork()
+
+    def _flush_batch(self):
+        """Send the commands queued by :meth:`Tao.batch`."""
+        batch = self._batch
+        if batch is not None and batch.pending:
+            pending, batch.pending = batch.pending, []
+            if self.stats is None:
+                batch.status.extend(self.pipe.commands(pending))
+            else:
+                start = default_timer()
+                batch.status.extend(self.pipe.commands(pending))
+                self.stats.record_many(pending, default_timer() - start)
+
+    def _python_array(self, shape, *command):
+        """
+        Execute a python command with numeric output and return a float
+        array. The values are parsed in the Tao process and transferred as a
+        single binary buffer.
+        """
+        return self._cached('array', command, lambda: self._fetch_array(
+            shape, *command))
+
+    def _fetch_array(self, shape, *command):
+        self._python_command(*command)
+        stats = self.stats
+        if stats is None:
+            ncols, data = self.pipe.scratch_array()
+            return _array_from_buffer(ncols, data, shape)
+        start = default_timer()
+        ncols, data = self.pipe.scratch_array()
+        array = _array_from_buffer(ncols, data, shape)
+        stats.record('scratch', default_timer() - start,
+                     len(array), array.nbytes)
+        return array
+
     def _parse_dict(self, data):
         """
         Data is a list of strings for the format "name;TYPE;TF;value."
@@ -383,29 +1260,42 @@ class Tao(object):
         """
         if not data or data[0][0] == 'INVALID':
             return OrderedDict()
-        return _convert_arrays(map(self._parse_dict_item, data))
-
-    def _parse_dict_item(self, fields):
-        name, kind = fields[:2]
+        if self.stats is None:
+            return self._get_schema(data).parse(data)
+        start = default_timer()
+        result = self._get_schema(data).parse(data)
+        self.stats.record('parse', default_timer() - start)
+        return result
+
+    def _get_schema(self, data):
+        """Get the cached :class:`DictSchema` for the layout of `data`."""
+        layout = tuple([(fields[0], fields[1]) for fields in data])
+        try:
+            return self._schemas[layout]
+        except KeyError:
+            pass
+        if len(self._schemas) >= MAX_SCHEMAS:
+            self._schemas.clear()
+        schema = self._schemas[layout] = DictSchema(layout, self._converter)
+        return schema
+
+    def _converter(self, name, kind):
+        """Return a function that parses the value from the fields of a
+        line with the given name and type. Override this to customize the
+        conversion of python command output."""
         if kind == 'STR':
-            value = fields[3]
+            return itemgetter(3)
         elif kind == 'INT':
-            value = self._parse(int, fields[3], fields)
+            return lambda fields: int(fields[3])
         elif kind == 'REAL':
-            value = self._parse(float, fields[3], fields)
+            return lambda fields: float(fields[3])
         elif kind == 'LOGIC':
-            value = fields[3] == 'T'
+            return lambda fields: fields[3] == 'T'
         elif kind == 'ENUM':
-            value = self._create_enum_value(name, fields[3])
+            create = self._create_enum_value
+            return lambda fields: create(name, fields[3])
         else:
-            value = fields[1]
-        return name.lower(), value
-
-    def _parse(self, dtype, value, fields):
-        try:
-            return dtype(value)
-        except ValueError:
-            raise ValueError("Cannot parse field {}: {!r}")
+            return lambda fields: kind
 
     def _create_enum_value(self, name, value):
         return value
@@ -416,65 +1306,233 @@ class Tao(object):
         # TODO: what to do for lists?
         # - currently converted to: [Parameter]
         # - should it be rather: Parameter([])?
-        return _convert_arrays(map(self._parse_param, data))
+        if self.stats is None:
+            return self._get_schema(data).parse_params(data)
+        start = default_timer()
+        result = self._get_schema(data).parse_params(data)
+        self.stats.record('parse', default_timer() - start)
+        return result
 
-    def _parse_param(self, fields):
-        key, value = self._parse_dict_item(fields)
-        vary = fields[2] == 'T'
-        return key, Parameter(key, value, vary)
 
+class _BatchedDirectory(object):
 
-RE_ARRAY = re.compile(r'^(.*)\[(\d+)\]$')
+    """The ``os`` functions of the Tao process for :class:`ChangeDirectory`
+    that send the commands queued by :meth:`Tao.batch` before changing the
+    directory."""
+
+    def __init__(self, tao):
+        self._tao = tao
+
+    def getcwd(self):
+        return self._tao.pipe.getcwd()
+
+    def chdir(self, path):
+        self._tao._flush_batch()
+        self._tao.pipe.chdir(path)
+
+
+class TaoTemplate(object):
+
+    """
+    Initialized Tao process that is forked to create new :class:`Tao`
+    instances without parsing the lattice again (posix only):
+
+        >>> template = TaoTemplate('-lat', 'my_lat.bmad')
+        >>> tao = template.spawn()
+        >>> pool = TaoPool(processes=4, template=template)
+
+    The new instances start with a copy of the state of the template
+    process, which can be prepared further using :attr:`tao` before
+    spawning. Files that are open in Tao are shared with the copies.
 
-def _convert_arrays(items):
+    :param initargs: command line arguments for tao
+    :param Popen_args: further arguments for :class:`Tao`
     """
-    Convert sequential data in properties to lists.
 
-    The command
+    def __init__(self, *initargs, **Popen_args):
+        if Popen_args.get('in_process'):
+            raise ValueError("Can't fork an in-process Tao.")
+        self.tao = Tao(*initargs, **Popen_args)
+        self._lock = threading.Lock()
+
+    def spawn(self, **kwargs):
+        """Create a new :class:`Tao` instance from the template. The keyword
+        arguments are passed to :class:`Tao`."""
+        return Tao(template=self, **kwargs)
+
+    def close(self):
+        """Stop the template process. Spawned instances keep running."""
+        self.tao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _fork(self):
+        with self._lock:
+            return self.tao._fork()
+
 
-        Tao> python plot_graph beta.g
+# The Tao instance that uses the tao library in this process (if any):
+_local_owner = None
 
-    contains the items
 
-        (num_curves, 2)
-        (curve[1], a)
-        (curve[2], b)
+def _acquire_local_pipe(owner):
+    """Load the tao library into this process for use by `owner`."""
+    global _local_owner
+    if _local_owner is not None:
+        raise RuntimeError(
+            "Only one in-process Tao instance can exist at a time.")
+    from pytao import tao_pipe
+    _local_owner = owner
+    return tao_pipe
 
-    which will be transformed to a single item:
 
-        (curve, [a, b])
+def _release_local_pipe(owner):
+    global _local_owner
+    if _local_owner is owner:
+        _local_owner = None
+
+
+RE_ARRAY = re.compile(r'^(.*)\[(\d+)\]$')
+RE_ATTR = re.compile(r'^\s*(\S+)\[(\w+)\]\s*$')
+
+
+def _parse_attr_spec(spec):
+    """Split an attribute specification ``'ELEMENT[attribute]'``."""
+    match = RE_ATTR.match(spec)
+    if not match:
+        raise ValueError(
+            "Expected 'ELEMENT[attribute]', got {!r}".format(spec))
+    return match.groups()
+
+
+def _element(name, universe, branch, which=None):
+    element = '{}@{}>>{}'.format(universe, branch, name)
+    return element if which is None else element + '|' + which
+
+
+def _setters(specs, universe, branch, which):
+    """Return the variable descriptions for ``tao_pipe.scan``."""
+    return [('set element {} {} ='.format(
+                _element(ele, universe, branch), attr),
+             _element(ele, universe, branch, which), attr)
+            for ele, attr in map(_parse_attr_spec, specs)]
+
+
+def _check_variable_lattice(which):
+    """Check that variables can be set in the lattice `which`."""
+    if which != 'model':
+        raise ValueError(
+            "Variables can only be set in the 'model' lattice, not {!r}"
+            .format(which))
+
+
+def _observables(specs, universe, branch, which):
+    """Return the observable descriptions for ``tao_pipe.scan``."""
+    return [(_element(ele, universe, branch, which), attr)
+            for ele, attr in map(_parse_attr_spec, specs)]
+
+
+# Maximum number of cached layouts per Tao instance:
+MAX_SCHEMAS = 256
+
+
+class DictSchema(object):
+
     """
-    result = OrderedDict()
-    arrays = set()
-    i0 = {}
-    for key, val in items:
-        m = RE_ARRAY.match(key)
-        if m:
-            name, index = m.groups()
-            l = result.setdefault(name, [])
-            l.append(val)
-            arrays.add(name)
-            # consistency check:
-            if len(l) == 1:
-                i0[name] = int(index)
-            elif int(index) != len(l):
+    Parser for python command output with a fixed layout, i.e. sequence of
+    names and types.
+
+    All the work that depends only on the layout (type dispatch, detection of
+    array items and their ``num_*s`` counters) is done once when the schema is
+    created. Afterwards, replies with the same layout can be converted in a
+    single pass. Array items ``name[i]`` are collected into a list ``name``,
+    and their ``num_names`` counter is removed.
+    """
+
+    def __init__(self, layout, converter):
+        """
+        Create schema for the given layout.
+
+            :param layout: sequence of ``(name, kind)`` tuples
+            :param converter: ``converter(name, kind)`` must return a function
+                              that parses the value from the line fields
+        """
+        self.names = [name for name, kind in layout]
+        self.keys = [name.lower() for name in self.names]
+        self.converters = [converter(name, kind) for name, kind in layout]
+        items = OrderedDict()
+        arrays = []
+        for i, key in enumerate(self.keys):
+            m = RE_ARRAY.match(key)
+            if m:
+                name, index = m.groups()
+                indices = items.setdefault(name, [])
+                indices.append(i)
+                if len(indices) == 1:
+                    arrays.append(name)
+                elif int(index) != len(indices):
+                    logging.getLogger(__name__).warn(
+                        "Inconsistent array order for array: {!r}\n"
+                        "    Got index {}, expected {}.\n"
+                        "    Please report this at https://github.com/hibtc/pytao/issues."
+                        .format(name, index, len(indices)))
+            else:
+                items[key] = i
+        # (name, index of counter, number of items) for consistency checks:
+        self.counts = [
+            (name, items.pop('num_'+name+'s', None), len(items[name]))
+            for name in arrays
+        ]
+        self.items = list(items.items())
+
+    def parse(self, data):
+        """Parse data to a dictionary of values."""
+        try:
+            values = [conv(fields)
+                      for conv, fields in zip(self.converters, data)]
+        except ValueError:
+            self._raise_parse_error(data)
+            raise
+        return self._assemble(values, values)
+
+    def parse_params(self, data):
+        """Parse data to a dictionary of :class:`Parameter`."""
+        try:
+            values = [conv(fields)
+                      for conv, fields in zip(self.converters, data)]
+        except ValueError:
+            self._raise_parse_error(data)
+            raise
+        params = [Parameter(key, value, fields[2] == 'T')
+                  for key, value, fields in zip(self.keys, values, data)]
+        return self._assemble(params, values)
+
+    def _assemble(self, items, values):
+        for name, index, length in self.counts:
+            count = 0 if index is None else int(values[index])
+            if count != length:
                 logging.getLogger(__name__).warn(
-                    "Inconsistent array order for array: {!r}\n"
-                    "    Got index {}, expected {}.\n"
+                    "Inconsistent array length for array: {!r}\n"
+                    "    Length advertised as {}, got only {} items.\n"
                     "    Please report this at https://github.com/hibtc/pytao/issues."
-                    .format(name, index, len(l)))
-        else:
-            result[key] = val
-    for name in arrays:
-        count = int(result.pop('num_'+name+'s', 0))
-        # consistency check:
-        if count != len(result[name]):
-            logging.getLogger(__name__).warn(
-                "Inconsistent array length for array: {!r}\n"
-                "    Length advertised as {}, got only {} items.\n"
-                "    Please report this at https://github.com/hibtc/pytao/issues."
-                .format(name, count, len(result[name])))
-    return result
+                    .format(name, count, length))
+        return OrderedDict([
+            (key, items[index] if isinstance(index, int) else
+             [items[i] for i in index])
+            for key, index in self.items
+        ])
+
+    def _raise_parse_error(self, data):
+        for name, conv, fields in zip(self.names, self.converters, data):
+            try:
+                conv(fields)
+            except ValueError:
+                raise ValueError("Cannot parse field {}: {!r}"
+                                 .format(name, fields[3]))
 
 
 def _parse_list(data):
@@ -495,9 +1553,28 @@ def _parse_array(data, shape=(0, 0)):
     return np.array([tuple(map(float, row)) for row in data])
 
 
-def _parse_curve(data):
-    """Make a numpy array from result of a python command."""
-    return _parse_array(data, (0, 3))[:,1:]
+def _array_from_buffer(ncols, data, shape=(0, 0)):
+    """Wrap a flat float64 buffer as numpy array with `ncols` columns."""
+    if not ncols:
+        return np.empty(shape)
+    return np.frombuffer(receive(data), dtype=np.float64).reshape(-1, ncols)
+
+
+def _curve_from_buffer(data):
+    """Make a curve array from the result of ``scratch_array``."""
+    if data is None:
+        return None
+    return _array_from_buffer(data[0], data[1], (0, 3))[:,1:]
+
+
+def _split_rows(text):
+    """Split python command output into lists of fields."""
+    return [line.split(';') for line in text.split('\n')] if text else []
+
+
+def _utf8_size(text):
+    """Return the size of `text` in bytes as transferred."""
+    return len(text.encode('utf-8'))
 
 
 def _rstrip(tup):
@@ -1,5 +1,5 @@
 cdef extern from "tao_c_interface_mod.h":
     int tao_c_set_init_args(const char*)
-    int tao_c_command(const char*)
+    int tao_c_command(const char*) nogil
     int tao_c_scratch_n_lines()
     const char* tao_c_scratch_line(int i)
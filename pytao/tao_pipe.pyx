@@ -1,30 +1,120 @@
 # cython: embedsignature=True
 
 cimport pytao.tao_c_interface_mod as clib
+from cpython cimport array
+from libc.stdio cimport FILE, fopen, fprintf, fclose
+from libc.stdlib cimport strtod
+from libc.string cimport strncmp
 
-from pytao.capture import capture as _capture
+from pytao.capture import CaptureIO, CaptureStream
+from pytao.service import register_after_fork
+from pytao.transport import export, receive
+from pytao import wire
 
+import array
+import atexit
+import hashlib
+import os
 import sys
+import tempfile
 from os import chdir, getcwd
 
 
 __all__ = [
     'set_init_args',
+    'set_shm_threshold',
+    'wire_open',
     'command',
+    'commands',
     'capture',
+    'capture_start',
+    'capture_read',
+    'capture_finish',
     'scratch_n_lines',
     'scratch_line',
+    'scratch_text',
+    'scratch_array',
+    'python_many',
+    'lattice_table',
+    'scan',
+    'plot_tree',
+    'curve_changes',
+    'get_beam',
+    'write_beam',
 
     'chdir',
     'getcwd',
 ]
 
 
+# Reused for all captures to avoid opening new file descriptors:
+_capture_io = CaptureIO()
+
+# Command running in the background, see capture_start:
+_stream = None
+
+# Minimum size of results that are sent via shared memory, see
+# set_shm_threshold:
+_shm_threshold = None
+
+# Particle file that was last passed to Tao, see write_beam:
+_beam_file = None
+
+def _after_fork():
+    # The capture file and beam file belong to the parent process:
+    global _capture_io, _stream, _beam_file
+    _capture_io = CaptureIO()
+    _stream = None
+    _beam_file = None
+
+register_after_fork(_after_fork)
+
+# Columns of a particle distribution, see get_beam:
+DEF BEAM_COLUMNS = 8
+
+
 def set_init_args(s):
     return clib.tao_c_set_init_args(s.encode('utf-8'))
 
+def set_shm_threshold(threshold):
+    """
+    Send results larger than `threshold` bytes via shared memory, see
+    :mod:`pytao.transport`. ``None`` disables the shared memory transport.
+    """
+    global _shm_threshold
+    _shm_threshold = threshold
+
+def wire_open(recv_path, send_path):
+    """
+    Serve the binary protocol of :mod:`pytao.wire` on the given named pipes
+    in a background thread. The client must open `recv_path` for writing
+    and then `send_path` for reading.
+    """
+    wire.serve(recv_path, send_path, {
+        'command': command,
+        'commands': commands,
+        'capture': capture,
+        'scratch_text': _scratch_text,
+        'scratch_array': _scratch_array,
+    })
+
 def command(s):
-    return clib.tao_c_command(s.encode('utf-8'))
+    if _stream is not None:
+        raise RuntimeError("Can't execute command while capture is running.")
+    return _command(s)
+
+def _command(s):
+    # Release the GIL, so other threads can run while Tao is busy:
+    cdef bytes b = s.encode('utf-8')
+    cdef const char* c = b
+    cdef int status
+    with nogil:
+        status = clib.tao_c_command(c)
+    return status
+
+def commands(cmds):
+    """Exec multiple commands and return the list of status codes."""
+    return [command(s) for s in cmds]
 
 def scratch_n_lines():
     return clib.tao_c_scratch_n_lines()
@@ -32,6 +122,442 @@ def scratch_n_lines():
 def scratch_line(i):
     return clib.tao_c_scratch_line(i).decode('utf-8', 'replace')
 
+def scratch_text():
+    """Return the whole scratch buffer as a single newline separated string."""
+    return export(_scratch_text(), _shm_threshold)
+
+def _scratch_text():
+    cdef int n = clib.tao_c_scratch_n_lines()
+    return '\n'.join([scratch_line(i+1) for i in range(n)])
+
+def scratch_array():
+    """
+    Parse the scratch buffer as a table of ';' separated floats.
+
+    Returns a tuple ``(ncols, data)`` where ``data`` is an ``array('d')``
+    containing the values of all lines in row-major order. ``ncols`` is zero
+    if the buffer is empty or INVALID.
+    """
+    ncols, data = _scratch_array()
+    return ncols, export(data, _shm_threshold)
+
+def _scratch_array():
+    cdef int n = clib.tao_c_scratch_n_lines()
+    cdef array.array data = array.array('d')
+    cdef Py_ssize_t size = 0
+    cdef int ncols = 0
+    cdef int col, i
+    cdef const char* p
+    cdef char* end
+    cdef double value
+    for i in range(n):
+        p = clib.tao_c_scratch_line(i+1)
+        if (i == 0 and strncmp(p, b"INVALID", 7) == 0 and
+                (p[7] == b';' or p[7] == 0)):
+            return 0, data
+        col = 0
+        while True:
+            value = strtod(p, &end)
+            if end == p:
+                raise ValueError("Cannot parse line {}: {!r}"
+                                 .format(i+1, scratch_line(i+1)))
+            array.resize_smart(data, size+1)
+            data.data.as_doubles[size] = value
+            size += 1
+            col += 1
+            p = end
+            while p[0] == b' ':
+                p += 1
+            if p[0] == b';':
+                p += 1
+            elif p[0] == 0:
+                break
+            else:
+                raise ValueError("Cannot parse line {}: {!r}"
+                                 .format(i+1, scratch_line(i+1)))
+        if i == 0:
+            ncols = col
+        elif col != ncols:
+            raise ValueError("Inconsistent number of columns in line {}: {!r}"
+                             .format(i+1, scratch_line(i+1)))
+    return ncols, data
+
+def python_many(cmds):
+    """Exec multiple python commands and return the list of their outputs
+    in the format of :func:`scratch_text`."""
+    outputs = []
+    for cmd in cmds:
+        command('python -noprint ' + cmd)
+        outputs.append(export(_scratch_text(), _shm_threshold))
+    return outputs
+
+def lattice_table(branch, which, names, groups):
+    """
+    Collect numeric attributes of all elements in a lattice branch.
+
+    :param str branch: branch specification, e.g. ``'1@0'``
+    :param str which: ``'model'``, ``'base'`` or ``'design'``
+    :param list names: lower case attribute names
+    :param list groups: ``lat_ele1`` attribute groups to search for the names
+
+    Returns a tuple ``(nrows, data)`` where ``data`` is an ``array('d')``
+    with one contiguous column of ``nrows`` values per name. Attributes
+    that are not available for an element are NaN.
+
+    Raises :class:`ValueError` for names that are not in any of the groups
+    for the first element.
+    """
+    command('python -noprint lat_ele_list ' + branch)
+    cdef int nrows = clib.tao_c_scratch_n_lines()
+    if nrows and scratch_line(1).split(';')[0] == 'INVALID':
+        nrows = 0
+    cdef array.array data = (array.array('d', [float('nan')]) *
+                             (nrows*len(names)))
+    cdef int i, col
+    located = {}
+    for i in range(nrows):
+        values = _element_values('{}>>{}|{}'.format(branch, i, which),
+                                 names, groups, located)
+        if i == 0:
+            unknown = [name for name in names if name not in values]
+            if unknown:
+                raise ValueError("Unknown attribute: {}"
+                                 .format(', '.join(unknown)))
+        for col, name in enumerate(names):
+            if name in values:
+                data.data.as_doubles[col*nrows+i] = values[name]
+    return nrows, export(data, _shm_threshold)
+
+def scan(variables, points, observables, groups):
+    """
+    Set variables to a sequence of values, recompute the lattice and
+    collect the observables at each point. The variables are restored
+    afterwards.
+
+    :param list variables: ``(set_prefix, element, name)`` for each
+                           variable, e.g. ``('set element Q1 k1 =',
+                           '1@0>>Q1|model', 'k1')``
+    :param list points: list of values for all variables at each point
+    :param list observables: ``(element, name)`` of each observable
+    :param list groups: ``lat_ele1`` attribute groups to search for the
+                        names
+
+    Returns a tuple ``(npoints, data)`` where ``data`` is an ``array('d')``
+    with one row of observable values per point. Values that are not
+    available are NaN.
+
+    Automatic lattice recomputation is disabled during the scan and
+    re-enabled afterwards if it was enabled before.
+    """
+    cdef int npoints = len(points)
+    cdef int nobs = len(observables)
+    cdef array.array data = (array.array('d', [float('nan')]) *
+                             (npoints*nobs))
+    cdef int i, col
+    located = {}
+    # read each element only once per point:
+    elements = {}
+    for col, (element, name) in enumerate(observables):
+        elements.setdefault(element, []).append((col, name.lower()))
+    initial = []
+    for prefix, element, name in variables:
+        values = _element_values(element, [name.lower()], groups, located)
+        if name.lower() not in values:
+            raise ValueError("Unknown attribute: {} of {}"
+                             .format(name, element))
+        initial.append(values[name.lower()])
+    command('python -noprint global')
+    calc_on = _scratch_values().get('lattice_calc_on', 1.0)
+    command('set global lattice_calc_on = F')
+    try:
+        for i, point in enumerate(points):
+            _set_values(variables, point)
+            for element, columns in elements.items():
+                values = _element_values(
+                    element, [name for col, name in columns],
+                    groups, located)
+                for col, name in columns:
+                    if name in values:
+                        data.data.as_doubles[i*nobs+col] = values[name]
+    finally:
+        _set_values(variables, initial)
+        if calc_on:
+            command('set global lattice_calc_on = T')
+    return npoints, export(data, _shm_threshold)
+
+def _set_values(variables, values):
+    """Set the variables and recompute the lattice once."""
+    for (prefix, element, name), value in zip(variables, values):
+        command('{} {}'.format(prefix, format(value, '.15e')))
+    command('set global lattice_calc_on = T')
+    command('set global lattice_calc_on = F')
+
+def _element_values(element, names, groups, located):
+    """
+    Return the numeric attributes with the given lower case names of an
+    element as dictionary. `located` maps names to the group in which they
+    were found before, and is updated. Only these groups are queried,
+    unless the element doesn't have all names there.
+    """
+    values = {}
+    queried = set()
+    for fallback in (False, True):
+        for group in groups:
+            if group in queried:
+                continue
+            wanted = [name for name in names if name not in values]
+            if not wanted:
+                return values
+            if not fallback and not any(
+                    located.get(name) == group for name in wanted):
+                continue
+            queried.add(group)
+            command('python -noprint lat_ele1 {} {}'.format(element, group))
+            found = _scratch_values()
+            for name in wanted:
+                if name in found:
+                    values[name] = found[name]
+                    located[name] = group
+    return values
+
+def plot_tree(plots=None, data=False):
+    """
+    Walk plots, their graphs and curves and return the output of the
+    respective python commands as nested structure::
+
+        [(plot, plot1_output, [
+            (graph, plot_graph_output, [
+                (curve, plot_curve_output, curve_data),
+                ...]),
+            ...]),
+         ...]
+
+    The outputs are returned in the format of :func:`scratch_text`. If
+    `data` is true, ``curve_data`` is the result of :func:`scratch_array`
+    for the ``plot_line`` command, otherwise ``None``. If `plots` is
+    ``None``, all plot templates are walked.
+    """
+    if plots is None:
+        plots = [line.split(';')[1]
+                 for line in _python_text('plot_list t').split('\n')
+                 if ';' in line and not line.startswith('INVALID')]
+    tree = []
+    for plot in plots:
+        plot_text = _python_text('plot1 ' + plot)
+        graphs = []
+        for graph in _array_items(plot_text, 'graph'):
+            graph_path = plot + '.' + graph
+            graph_text = _python_text('plot_graph ' + graph_path)
+            curves = []
+            for curve in _array_items(graph_text, 'curve'):
+                curve_path = graph_path + '.' + curve
+                curve_text = _python_text('plot_curve ' + curve_path)
+                if data:
+                    command('python -noprint plot_line ' + curve_path)
+                    curve_data = scratch_array()
+                else:
+                    curve_data = None
+                curves.append((curve, export(curve_text, _shm_threshold),
+                               curve_data))
+            graphs.append((graph, export(graph_text, _shm_threshold),
+                           curves))
+        tree.append((plot, export(plot_text, _shm_threshold), graphs))
+    return tree
+
+def curve_changes(names, digests):
+    """
+    Compute the data of the given curves and return only those that differ
+    from the known state.
+
+    :param list names: curve names
+    :param dict digests: known content digests of (some of) the curves
+
+    Returns a dictionary ``{name: (digest, curve_data)}`` for all curves
+    whose digest differs, where ``curve_data`` is the result of
+    :func:`scratch_array` for the ``plot_line`` command.
+    """
+    changes = {}
+    for name in names:
+        text = _python_text('plot_line ' + name)
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        if digests.get(name) != digest:
+            changes[name] = (digest, scratch_array())
+    return changes
+
+def get_beam(ele_id, int ix_bunch):
+    """
+    Get the particle distribution of a bunch saved at an element.
+
+    :param str ele_id: element specification, e.g. ``'1@0>>end'``
+    :param int ix_bunch: bunch index (starting at 1)
+
+    Returns a tuple ``(n, data)`` where ``data`` is an ``array('d')`` with
+    one contiguous column of ``n`` values for each of x, px, y, py, z, pz,
+    charge and state. Tao writes the beam as ASCII file, which is parsed
+    here, so only the binary array is transferred.
+
+    Raises :class:`RuntimeError` if Tao fails to write the beam or the
+    bunch has no particles, e.g. because the beam was not saved at the
+    element.
+    """
+    fd, path = tempfile.mkstemp(suffix='.beam')
+    os.close(fd)
+    try:
+        status = command('write beam -ascii -at {} {}'.format(ele_id, path))
+        if status:
+            raise RuntimeError("Failed to write beam at {} (status {})."
+                               .format(ele_id, status))
+        n, data = _read_beam(path, ix_bunch)
+    finally:
+        os.remove(path)
+    if not n:
+        raise RuntimeError("No particles in bunch {} at {}."
+                           .format(ix_bunch, ele_id))
+    return n, export(data, _shm_threshold)
+
+def write_beam(data, int n, species):
+    """
+    Write a particle distribution to a file that Tao can read as
+    ``beam_init%position_file``. Returns the file name.
+
+    :param data: column-major float64 buffer (or a ``SharedBuffer`` with
+                 it) with the 8 columns described in :func:`get_beam`
+    :param int n: number of particles
+    :param str species: particle species, e.g. ``'electron'``
+
+    The file is removed when the next distribution is written or on exit.
+    """
+    global _beam_file
+    cdef const double[::1] values = receive(data)
+    if values.shape[0] != BEAM_COLUMNS * n:
+        raise ValueError("Expected {} particles, got {} values."
+                         .format(n, values.shape[0]))
+    cdef const double* v = &values[0] if n else NULL
+    cdef double charge = 0
+    cdef int i, col
+    for i in range(n):
+        charge += v[(BEAM_COLUMNS-2)*n+i]
+    fd, path = tempfile.mkstemp(suffix='.beam')
+    os.close(fd)
+    cdef bytes b_path = path.encode(sys.getfilesystemencoding())
+    cdef bytes b_species = species.encode('utf-8')
+    cdef FILE* f = fopen(b_path, b"w")
+    if f == NULL:
+        raise IOError("Cannot open {!r} for writing.".format(path))
+    try:
+        fprintf(f, b"!ASCII::3\n0\n1\n%d\nBEGIN_BUNCH\n", n)
+        fprintf(f, b"%s\n%.16e\n0.0\n0.0\n", <const char*> b_species,
+                charge)
+        for i in range(n):
+            for col in range(BEAM_COLUMNS-1):
+                fprintf(f, b" %.16e", v[col*n+i])
+            fprintf(f, b" %d\n", <int> v[(BEAM_COLUMNS-1)*n+i])
+        fprintf(f, b"END_BUNCH\n")
+    finally:
+        fclose(f)
+    _remove_beam_file()
+    _beam_file = path
+    return path
+
+def _remove_beam_file():
+    global _beam_file
+    if _beam_file is not None:
+        try:
+            os.remove(_beam_file)
+        except OSError:
+            pass
+        _beam_file = None
+
+atexit.register(_remove_beam_file)
+
+def _read_beam(path, int ix_bunch):
+    """Parse the particles of one bunch in an ASCII beam file."""
+    cdef list columns = [array.array('d') for _ in range(BEAM_COLUMNS)]
+    cdef array.array column
+    cdef double values[BEAM_COLUMNS]
+    cdef Py_ssize_t n = 0
+    cdef int bunch = 0
+    cdef int col
+    cdef const char* p
+    cdef char* end
+    cdef bytes line
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.lstrip().startswith(b'BEGIN_BUNCH'):
+                bunch += 1
+                continue
+            if bunch != ix_bunch:
+                continue
+            # Particle lines are the only ones with (at least) 8 numbers:
+            p = line
+            for col in range(BEAM_COLUMNS):
+                values[col] = strtod(p, &end)
+                if end == p:
+                    break
+                p = end
+            else:
+                for col in range(BEAM_COLUMNS):
+                    column = columns[col]
+                    array.resize_smart(column, n+1)
+                    column.data.as_doubles[n] = values[col]
+                n += 1
+    data = columns[0]
+    for column in columns[1:]:
+        data.extend(column)
+    return n, data
+
+def _python_text(cmd):
+    """Exec python command and return the output as single string."""
+    command('python -noprint ' + cmd)
+    return _scratch_text()
+
+def _array_items(text, name):
+    """Return the values of all items ``name[i]`` in dict-like output."""
+    prefix = name + '['
+    return [fields[3]
+            for fields in (line.split(';') for line in text.split('\n'))
+            if len(fields) > 3 and fields[0].lower().startswith(prefix)]
+
+def _scratch_values():
+    """Return numeric values of a dict-like scratch buffer as dictionary
+    with lower case keys."""
+    values = {}
+    for i in range(clib.tao_c_scratch_n_lines()):
+        fields = scratch_line(i+1).split(';')
+        if len(fields) < 4:
+            continue
+        kind = fields[1]
+        if kind == 'REAL' or kind == 'INT':
+            try:
+                values[fields[0].lower()] = float(fields[3])
+            except ValueError:
+                pass
+        elif kind == 'LOGIC':
+            values[fields[0].lower()] = 1.0 if fields[3] == 'T' else 0.0
+    return values
+
 def capture(s):
     """Exec command and return the output string."""
-    return _capture(command, s)
+    return _capture_io.capture(command, s)
+
+def capture_start(s):
+    """
+    Start executing a command in the background. The output can be fetched
+    incrementally using :func:`capture_read` while the command is running.
+    Must be followed by a call to :func:`capture_finish`.
+    """
+    global _stream
+    if _stream is not None:
+        raise RuntimeError("Capture is already running.")
+    _stream = CaptureStream(_command, s)
+
+def capture_read(size=65536):
+    """Return the next chunk of output as bytes, or empty bytes at the end."""
+    return _stream.read(size)
+
+def capture_finish():
+    """Discard remaining output, wait for the command and return its status."""
+    global _stream
+    stream, _stream = _stream, None
+    if stream is not None:
+        return stream.close()
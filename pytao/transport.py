@@ -0,0 +1,139 @@
+# encoding: utf-8
+"""
+Shared memory transport for large payloads.
+
+Payloads above a size threshold are written into a file in shared memory
+(``/dev/shm`` if available, otherwise the temporary directory) and only a
+small :class:`SharedBuffer` handle is sent over the RPC pipe. The receiver
+maps the file into memory and removes it, which avoids pickling and
+copying the data through the pipe.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import array
+import mmap
+import os
+import tempfile
+
+
+__all__ = [
+    'SHM_THRESHOLD',
+    'SharedBuffer',
+    'export',
+    'receive',
+]
+
+
+# Default minimum size in bytes for sending payloads via shared memory:
+SHM_THRESHOLD = 1 << 20
+
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+try:
+    unicode
+except NameError:   # python 3
+    unicode = str
+
+
+class SharedBuffer(object):
+
+    """
+    Handle to a payload in a shared memory file.
+
+    :ivar str path: file name
+    :ivar int size: size in bytes
+    :ivar str typecode: ``'text'`` for utf-8 encoded text, ``'B'`` for
+                        bytes, or the :mod:`array` typecode of the items
+    """
+
+    def __init__(self, path, size, typecode):
+        self.path = path
+        self.size = size
+        self.typecode = typecode
+
+    def load(self):
+        """
+        Map the file into memory and remove it. Returns a text string for
+        text payloads, and a writable buffer object otherwise. Must be
+        called exactly once.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), self.size,
+                                access=mmap.ACCESS_COPY)
+        finally:
+            try:
+                os.remove(self.path)
+            except OSError:     # windows can't remove mapped files
+                pass
+        if self.typecode == 'text':
+            try:
+                return buf[:].decode('utf-8', 'replace')
+            finally:
+                buf.close()
+        if self.typecode == 'B':
+            return buf
+        try:
+            return memoryview(buf).cast(self.typecode)
+        except AttributeError:  # python 2
+            data = array.array(str(self.typecode))
+            data.fromstring(buf[:])
+            buf.close()
+            return data
+
+
+def export(data, threshold):
+    """
+    Return `data` unchanged if it is smaller than `threshold` bytes (or if
+    `threshold` is ``None``), otherwise write it to shared memory and
+    return a :class:`SharedBuffer`.
+
+    `data` may be a text string, bytes, an :class:`array.array` or a
+    contiguous numpy array.
+    """
+    if threshold is None:
+        return data
+    text = None
+    if isinstance(data, unicode):
+        # quick check, since utf-8 needs at most 4 bytes per character:
+        if 4 * len(data) < threshold:
+            return data
+        text, data = data, data.encode('utf-8')
+        typecode = 'text'
+    elif isinstance(data, array.array):
+        typecode = data.typecode
+    elif hasattr(data, 'dtype'):
+        typecode = data.dtype.char
+    else:
+        typecode = 'B'
+    size = _nbytes(data)
+    if size == 0 or size < threshold:
+        return data if text is None else text
+    fd, path = tempfile.mkstemp(prefix='pytao-', dir=SHM_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                data.tofile(f)
+    except Exception:
+        os.remove(path)
+        raise
+    return SharedBuffer(path, size, typecode)
+
+
+def receive(data):
+    """Return the content if `data` is a :class:`SharedBuffer`, otherwise
+    return `data` itself."""
+    if isinstance(data, SharedBuffer):
+        return data.load()
+    return data
+
+
+def _nbytes(data):
+    if isinstance(data, array.array):
+        return len(data) * data.itemsize
+    nbytes = getattr(data, 'nbytes', None)
+    return len(data) if nbytes is None else nbytes
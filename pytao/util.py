@@ -8,6 +8,8 @@ from __future__ import unicode_literals
 
 from math import sqrt
 
+import numpy as np
+
 #----------------------------------------
 # Time transformations
 #----------------------------------------
@@ -41,3 +43,94 @@ def z_to_t(z, pz, beta, e_tot, p0c, **ignore):
     t  =   z   /beta
     pt = (pz+1)/beta - e_tot/p0c
     return t, pt
+
+
+# Vectorized versions for particle distributions:
+
+def t_to_z_array(t, pt, M, E0, out=None):
+    """
+    Transform canonical coordinates of many particles: t,pt -> z,pz (i.e.
+    MAD-X to Bmad). Same as :func:`t_to_z`, but for arrays.
+
+    The result is written to `out`, a tuple of two arrays ``(z, pz)`` if
+    given. These may be the input arrays ``(t, pt)`` to transform in place.
+    """
+    t = np.asarray(t, dtype=float)
+    pt = np.asarray(pt, dtype=float)
+    if out is None:
+        out = (np.empty_like(t), np.empty_like(pt))
+    z, pz = out
+    P0    = sqrt(E0**2 - M**2)
+    # explicit outputs, so the temporaries are arrays even for 0-d input:
+    E1    = np.multiply(pt, P0, out=np.empty_like(pt))
+    E1   += E0
+    P1    = np.square(E1, out=np.empty_like(E1))
+    P1   -= M**2
+    np.sqrt(P1, out=P1)
+    bet_1 = np.divide(P1, E1, out=E1)
+    np.multiply(bet_1, t, out=z)
+    np.subtract(P1, P0, out=pz)
+    pz   /= P0
+    return z, pz
+
+
+def z_to_t_array(z, pz, beta, e_tot, p0c, out=None, **ignore):
+    """
+    Transform canonical coordinates of many particles: z,pz -> t,pt (i.e.
+    Bmad to MAD-X). Same as :func:`z_to_t`, but for arrays.
+
+    The result is written to `out`, a tuple of two arrays ``(t, pt)`` if
+    given. These may be the input arrays ``(z, pz)`` to transform in place.
+    """
+    z = np.asarray(z, dtype=float)
+    pz = np.asarray(pz, dtype=float)
+    if out is None:
+        out = (np.empty_like(z), np.empty_like(pz))
+    t, pt = out
+    np.divide(z, beta, out=t)
+    np.add(pz, 1, out=pt)
+    pt /= beta
+    pt -= e_tot/p0c
+    return t, pt
+
+
+def madx_to_bmad(coords, M, E0, out=None):
+    """
+    Transform a 6xN phase space array (x,px,y,py,t,pt) from MAD-X to Bmad
+    coordinates (x,px,y,py,z,pz). The transverse coordinates are unchanged.
+
+    The result is written to `out` if given, which may be `coords` itself
+    to transform in place.
+    """
+    coords = np.asarray(coords, dtype=float)
+    out = _prepare_phase_space(coords, out)
+    t_to_z_array(coords[4], coords[5], M, E0, out=(out[4], out[5]))
+    return out
+
+
+def bmad_to_madx(coords, beta, e_tot, p0c, out=None, **ignore):
+    """
+    Transform a 6xN phase space array (x,px,y,py,z,pz) from Bmad to MAD-X
+    coordinates (x,px,y,py,t,pt). The transverse coordinates are unchanged.
+
+    The result is written to `out` if given, which may be `coords` itself
+    to transform in place.
+    """
+    coords = np.asarray(coords, dtype=float)
+    out = _prepare_phase_space(coords, out)
+    z_to_t_array(coords[4], coords[5], beta, e_tot, p0c,
+                 out=(out[4], out[5]))
+    return out
+
+
+def _prepare_phase_space(coords, out):
+    """Check shape of a phase space array and copy transverse coordinates
+    to the output array."""
+    if coords.ndim != 2 or coords.shape[0] != 6:
+        raise ValueError("Expected phase space array of shape (6, N), got {}"
+                         .format(coords.shape))
+    if out is None:
+        out = np.empty_like(coords)
+    if out is not coords:
+        out[:4] = coords[:4]
+    return out
@@ -0,0 +1,344 @@
+# encoding: utf-8
+"""
+Binary protocol for the most frequent calls to the Tao process.
+
+The minrpc connection pickles every request and reply, which dominates the
+cost of short calls like :func:`~pytao.tao_pipe.command`. With
+``Tao(protocol='binary')``, these calls are instead sent as length-prefixed
+frames over a separate pair of named pipes (posix only), which are served
+by a thread in the Tao process:
+
+    request:    opcode (uint8), payload size (uint64), payload
+    reply:      status (uint8), payload size (uint64), payload
+
+The payloads are utf-8 text, lists of text (the number of items as uint32,
+followed by the ``'\\0'`` separated items), or typed numeric sections
+(native int32 or float64 values). A reply with status :data:`ERROR`
+contains the type and message of an exception.
+
+Only the functions in :data:`OPCODES` use the binary protocol. All other
+functions of :mod:`pytao.tao_pipe` are still called via minrpc.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import array
+import errno
+import io
+import os
+import struct
+import threading
+
+from minrpc.client import RemoteProcessCrashed
+
+from pytao.capture import start_thread
+from pytao.service import connect_fifos, register_after_fork
+
+
+__all__ = [
+    'OPCODES',
+    'WirePipe',
+    'connect',
+    'serve',
+    'encode_request',
+    'decode_reply',
+    'split_frames',
+]
+
+
+HEADER = struct.Struct('=BQ')
+INT = struct.Struct('=i')
+COUNT = struct.Struct('=I')
+
+# Reply status:
+OK = 0
+ERROR = 1
+
+# Opcodes of the functions of tao_pipe that use the binary protocol:
+OPCODES = {
+    'command': 1,
+    'commands': 2,
+    'capture': 3,
+    'scratch_text': 4,
+    'scratch_array': 5,
+}
+
+# File descriptors of the pipes served in this process:
+_served_fds = set()
+
+
+def _after_fork():
+    # The serving threads don't exist in a forked process, and the client
+    # must see the end of file when the parent process exits:
+    for fd in _served_fds:
+        os.close(fd)
+    _served_fds.clear()
+
+register_after_fork(_after_fork)
+
+
+# Exceptions that are re-raised with the same type in the client:
+EXCEPTIONS = {cls.__name__: cls for cls in (
+    RuntimeError, ValueError, TypeError, KeyError, IndexError)}
+
+
+def _encode_text(text):
+    return text.encode('utf-8')
+
+
+def _decode_text(data):
+    return data.decode('utf-8', 'replace')
+
+
+def _encode_list(texts):
+    # the count distinguishes [] from ['']:
+    return COUNT.pack(len(texts)) + '\0'.join(texts).encode('utf-8')
+
+
+def _decode_list(data):
+    count = COUNT.unpack(data[:COUNT.size])[0]
+    if not count:
+        return []
+    texts = data[COUNT.size:].decode('utf-8').split('\0')
+    if len(texts) != count:
+        raise ValueError("Expected {} items, got {}."
+                         .format(count, len(texts)))
+    return texts
+
+
+def _encode_none(value):
+    return b''
+
+
+# Decoders of the arguments return the tuple of arguments for the function:
+
+def _args_text(data):
+    return (_decode_text(data),)
+
+
+def _args_list(data):
+    return (_decode_list(data),)
+
+
+def _args_none(data):
+    return ()
+
+
+def _encode_status(status):
+    return INT.pack(status or 0)
+
+
+def _decode_status(data):
+    return INT.unpack(data)[0]
+
+
+def _encode_statuses(statuses):
+    return _tobytes(array.array(str('i'), [s or 0 for s in statuses]))
+
+
+def _decode_statuses(data):
+    return array.array(str('i'), data).tolist()
+
+
+def _encode_table(result):
+    ncols, data = result
+    return INT.pack(ncols) + _tobytes(data)
+
+
+def _decode_table(data):
+    # keep the values writable, like the arrays received via minrpc:
+    return INT.unpack(data[:INT.size])[0], bytearray(data[INT.size:])
+
+
+# {name: (encode_args, decode_args, encode_result, decode_result)}:
+CODECS = {
+    'command': (_encode_text, _args_text, _encode_status, _decode_status),
+    'commands': (_encode_list, _args_list,
+                 _encode_statuses, _decode_statuses),
+    'capture': (_encode_text, _args_text, _encode_text, _decode_text),
+    'scratch_text': (_encode_none, _args_none, _encode_text, _decode_text),
+    'scratch_array': (_encode_none, _args_none,
+                      _encode_table, _decode_table),
+}
+
+
+class WirePipe(object):
+
+    """
+    Proxy for the :mod:`pytao.tao_pipe` module of a Tao process that sends
+    the functions in :data:`OPCODES` via the binary protocol, and forwards
+    all other calls to `module`. When the process has crashed, the RPC
+    `client` is marked as crashed as well.
+    """
+
+    def __init__(self, client, module, recv_fd, send_fd):
+        self._client = client
+        self._module = module
+        self._recv = io.open(recv_fd, 'rb')
+        self._send_fd = send_fd
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def command(self, s):
+        return self._call('command', s)
+
+    def commands(self, cmds):
+        return self._call('commands', cmds)
+
+    def capture(self, s):
+        return self._call('capture', s)
+
+    def scratch_text(self):
+        return self._call('scratch_text', None)
+
+    def scratch_array(self):
+        return self._call('scratch_array', None)
+
+    def close(self):
+        """Close the pipes, which stops the serving thread."""
+        if self._send_fd is not None:
+            os.close(self._send_fd)
+            self._send_fd = None
+            self._recv.close()
+
+    def _call(self, name, args):
+        with self._lock:
+            if self._send_fd is None:
+                raise RuntimeError("Binary protocol is closed.")
+            try:
+                _write(self._send_fd, encode_request(name, args))
+            except OSError as e:
+                if e.errno != errno.EPIPE:
+                    raise
+                frame = None
+            else:
+                frame = _read_frame(self._recv)
+            if frame is None:
+                self._client.mark_crashed()
+                raise RemoteProcessCrashed()
+        return decode_reply(name, *frame)
+
+
+def encode_request(name, args):
+    """Return the request frame for calling the function `name` of
+    :data:`OPCODES` with `args`."""
+    return _frame(OPCODES[name], CODECS[name][0](args))
+
+
+def decode_reply(name, status, payload):
+    """Return the result of the function `name` from its reply frame, or
+    raise the exception that it contains."""
+    if status != OK:
+        kind, _, message = _decode_text(payload).partition(': ')
+        raise EXCEPTIONS.get(kind, RuntimeError)(message)
+    return CODECS[name][3](payload)
+
+
+def split_frames(buffer):
+    """Remove all complete frames from the start of `buffer` (a
+    :class:`bytearray` of received data) and return them as list of ``(code,
+    payload)``."""
+    frames = []
+    start = 0
+    while len(buffer) - start >= HEADER.size:
+        code, size = HEADER.unpack_from(buffer, start)
+        end = start + HEADER.size + size
+        if len(buffer) < end:
+            break
+        frames.append((code, bytes(buffer[start+HEADER.size:end])))
+        start = end
+    del buffer[:start]
+    return frames
+
+
+def connect(client, module):
+    """
+    Start serving the binary protocol in the Tao process of `client` and
+    return a :class:`WirePipe` for `module` (the remote :mod:`pytao.tao_pipe`
+    module).
+    """
+    recv_fd, send_fd, _ = connect_fifos(module.wire_open)
+    return WirePipe(client, module, recv_fd, send_fd)
+
+
+def serve(recv_path, send_path, functions):
+    """
+    Serve requests for `functions` (a dictionary of the functions in
+    :data:`OPCODES` by name) on the given named pipes in a daemon thread.
+    The thread exits when the client closes the pipes. Returns the thread.
+
+    The thread executes Tao commands, so it gets the same large stack as
+    :class:`~pytao.capture.CaptureStream`.
+    """
+    handlers = {OPCODES[name]: (func,) + CODECS[name][1:3]
+                for name, func in functions.items()}
+    thread = threading.Thread(
+        target=_serve, args=(recv_path, send_path, handlers))
+    thread.daemon = True
+    start_thread(thread)
+    return thread
+
+
+def _serve(recv_path, send_path, handlers):
+    recv_fd = os.open(recv_path, os.O_RDONLY)
+    send_fd = os.open(send_path, os.O_WRONLY)
+    _served_fds.update((recv_fd, send_fd))
+    try:
+        with io.open(recv_fd, 'rb') as recv:
+            while True:
+                frame = _read_frame(recv)
+                if frame is None:
+                    break
+                opcode, payload = frame
+                try:
+                    func, decode_args, encode_result = handlers[opcode]
+                    reply = encode_result(func(*decode_args(payload)))
+                    status = OK
+                except Exception as e:
+                    reply = _encode_text('{}: {}'.format(type(e).__name__, e))
+                    status = ERROR
+                _write_frame(send_fd, status, reply)
+    except OSError:     # client is gone
+        pass
+    finally:
+        _served_fds.difference_update((recv_fd, send_fd))
+        os.close(send_fd)
+
+
+def _tobytes(data):
+    try:
+        return data.tobytes()
+    except AttributeError:  # python 2
+        return data.tostring()
+
+
+def _frame(code, payload):
+    return HEADER.pack(code, len(payload)) + payload
+
+
+def _write_frame(fd, code, payload):
+    _write(fd, _frame(code, payload))
+
+
+def _write(fd, data):
+    written = os.write(fd, data)
+    if written < len(data):
+        data = memoryview(data)
+        while written < len(data):
+            written += os.write(fd, data[written:])
+
+
+def _read_frame(f):
+    """Read a frame as ``(code, payload)`` from a buffered file, or return
+    ``None`` at end of file."""
+    header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    code, size = HEADER.unpack(header)
+    payload = f.read(size) if size else b''
+    if len(payload) < size:
+        return None
+    return code, payload
@@ -88,7 +88,11 @@ def fix_distutils_sysconfig_mingw():
 
 
 def get_setup_args(argv):
-    extension_args = get_extension_args(argv)
+    if '--fake-tao' in argv:
+        argv.remove('--fake-tao')
+        extension_args = get_fake_extension_args()
+    else:
+        extension_args = get_extension_args(argv)
     long_description = get_long_description()
     metadata = exec_file('pytao/__init__.py')
     return dict(
@@ -105,12 +109,14 @@ def get_setup_args(argv):
         ],
         ext_modules = cythonize([
             Extension('pytao.tao_pipe',
-                      sources=["pytao/tao_pipe.pyx"],
+                      sources=["pytao/tao_pipe.pyx"] +
+                      extension_args.pop('extra_sources', []),
                       **extension_args),
         ]),
         install_requires=[
             'setuptools',
             'minrpc==0.0.7',
+            'futures; python_version < "3.2"',
         ],
         package_data={
             'pytao': [
@@ -226,5 +232,17 @@ def get_extension_args(argv):
     )
 
 
+def get_fake_extension_args():
+    """
+    Get arguments for building the C-extension against the synthetic tao
+    stand-in from the benchmarks folder instead of a Bmad installation.
+    """
+    return dict(
+        extra_sources=['benchmarks/faketao.c'],
+        include_dirs=['pytao'],
+        extra_compile_args=['-std=gnu99'],
+    )
+
+
 if __name__ == '__main__':
     main(sys.argv)
@@ -0,0 +1,43 @@
+# encoding: utf-8
+"""
+Fixtures for tests that need a Tao process. These run against the synthetic
+tao stand-in and are skipped otherwise:
+
+    python setup.py build_ext --inplace --fake-tao
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import pytest
+
+
+def _is_fake_tao(tao):
+    tao.command('fake_lines 3')
+    return len(tao.python('lat_ele_list 1@0')) == 3
+
+
+@pytest.fixture(scope='session')
+def fake_tao_available():
+    try:
+        from pytao.tao import Tao
+        tao = Tao()
+    except Exception:
+        return False
+    try:
+        return _is_fake_tao(tao)
+    except Exception:
+        return False
+    finally:
+        tao.close()
+
+
+@pytest.fixture
+def tao(fake_tao_available):
+    if not fake_tao_available:
+        pytest.skip("requires the synthetic tao stand-in")
+    from pytao.tao import Tao
+    tao = Tao()
+    tao.command('fake_lines 3')
+    yield tao
+    tao.close()
@@ -0,0 +1,64 @@
+# encoding: utf-8
+"""
+Tests for AsyncTao.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import asyncio
+
+import pytest
+
+from pytao.aio import AsyncTao
+
+
+@pytest.fixture
+def run(fake_tao_available):
+    if not fake_tao_available:
+        pytest.skip("requires the synthetic tao stand-in")
+    def run(test):
+        async def main():
+            async with AsyncTao() as tao:
+                return await test(tao)
+        return asyncio.run(main())
+    return run
+
+
+def test_gather_order(run):
+    async def test(tao):
+        requests = []
+        for lines in range(1, 6):
+            requests.append(tao.command('fake_lines', lines))
+            requests.append(tao.get_list('lat_ele_list 1@0'))
+        return await asyncio.gather(*requests)
+    results = run(test)
+    assert results[::2] == [None] * 5
+    assert [len(names) for names in results[1::2]] == [1, 2, 3, 4, 5]
+
+
+def test_gather_errors(run):
+    def fail(tao):
+        raise ValueError("failed")
+
+    async def test(tao):
+        await tao.command('fake_lines 2')
+        return await asyncio.gather(
+            tao.python('lat_ele_list 1@0'),
+            tao.call(fail),
+            tao.command_many(['fake_lines 3', '']),
+            tao.python('lat_ele_list 1@0'),
+            return_exceptions=True)
+    before, error, status, after = run(test)
+    assert isinstance(error, ValueError)
+    assert len(before) == 2
+    assert status == [0, 0]
+    assert len(after) == 3
+
+
+def test_closed(run):
+    async def test(tao):
+        await tao.close()
+        with pytest.raises(RuntimeError):
+            await tao.command('fake_lines 1')
+    run(test)
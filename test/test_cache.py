@@ -0,0 +1,89 @@
+# encoding: utf-8
+"""
+Tests for the result cache. Only the invalidation by Tao commands needs the
+synthetic tao stand-in.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import pytest
+
+from pytao.cache import ResultCache
+
+
+def compute(value):
+    calls = []
+    def compute():
+        calls.append(value)
+        return value
+    compute.calls = calls
+    return compute
+
+
+def test_hits_and_misses():
+    cache = ResultCache(2)
+    a = compute('a')
+    assert cache.get('a', a) == 'a'
+    assert cache.get('a', a) == 'a'
+    assert a.calls == ['a']
+    info = cache.info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+
+
+def test_lru_eviction():
+    cache = ResultCache(2)
+    cache.get('a', compute('a'))
+    cache.get('b', compute('b'))
+    cache.get('a', compute('a'))       # now 'b' is least recently used
+    cache.get('c', compute('c'))
+    assert cache.info().evictions == 1
+    b = compute('b')
+    a = compute('a')
+    cache.get('a', a)
+    cache.get('b', b)
+    assert a.calls == []
+    assert b.calls == ['b']
+    assert len(cache) == 2
+
+
+def test_disabled():
+    cache = ResultCache(0)
+    a = compute('a')
+    cache.get('a', a)
+    cache.get('a', a)
+    assert a.calls == ['a', 'a']
+    assert len(cache) == 0
+
+
+def test_clear():
+    cache = ResultCache(2)
+    cache.clear()
+    assert cache.info().invalidations == 0
+    cache.get('a', compute('a'))
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.info().invalidations == 1
+
+
+def test_invalidate_by_command(fake_tao_available):
+    if not fake_tao_available:
+        pytest.skip("requires the synthetic tao stand-in")
+    from pytao.tao import Tao
+    tao = Tao(cache_size=4)
+    try:
+        tao.command('fake_lines 2')
+        generation = tao.generation
+        first = tao.properties('lat_ele1 1@0>>1|model general')
+        assert tao.properties('lat_ele1 1@0>>1|model general') is first
+        tao.python('lat_ele_list 1@0')
+        assert tao.generation == generation
+        assert tao.cache_info().hits == 1
+        tao.command('set element 1@0>>1 k1 = 0.5')
+        assert tao.generation == generation + 1
+        assert tao.cache_info().currsize == 0
+        second = tao.properties('lat_ele1 1@0>>1|model general')
+        assert second['k1'] == 0.5
+        assert first['k1'] == 0
+    finally:
+        tao.close()
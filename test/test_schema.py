@@ -0,0 +1,127 @@
+# encoding: utf-8
+"""
+Tests for DictSchema. The expected results are computed with the item by
+item parser that DictSchema replaced. These don't need Tao.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+import pytest
+
+from pytao.tao import Tao, Parameter, RE_ARRAY
+
+
+def _parse_dict_item(fields):
+    name, kind = fields[:2]
+    if kind == 'STR':
+        value = fields[3]
+    elif kind == 'INT':
+        value = int(fields[3])
+    elif kind == 'REAL':
+        value = float(fields[3])
+    elif kind == 'LOGIC':
+        value = fields[3] == 'T'
+    elif kind == 'ENUM':
+        value = fields[3]
+    else:
+        value = fields[1]
+    return name.lower(), value
+
+
+def _parse_param(fields):
+    key, value = _parse_dict_item(fields)
+    return key, Parameter(key, value, fields[2] == 'T')
+
+
+def _convert_arrays(items):
+    result = OrderedDict()
+    arrays = set()
+    for key, val in items:
+        m = RE_ARRAY.match(key)
+        if m:
+            result.setdefault(m.group(1), []).append(val)
+            arrays.add(m.group(1))
+        else:
+            result[key] = val
+    for name in arrays:
+        result.pop('num_'+name+'s', None)
+    return result
+
+
+def _split(text):
+    return [line.split(';') for line in text.strip().split('\n')]
+
+
+OUTPUTS = [
+    # lat_ele1 ... twiss:
+    _split("""
+beta_a;REAL;T;  4.4000000000000000E+01
+alpha_a;REAL;T; -7.0000000000000000E+00
+gamma_a;REAL;F;  1.1363636363636365E+00
+phi_a;REAL;F;  0.0000000000000000E+00
+mode_flip;LOGIC;F;F
+"""),
+    # plot_graph with arrays and their counters:
+    _split("""
+name;STR;F;g
+graph^type;ENUM;T;data
+num_curves;INT;F;2
+curve[1];STR;T;a
+curve[2];STR;T;b
+visible;LOGIC;T;T
+ix_universe;INT;T;-1
+Title;STR;T;Beta [m]
+"""),
+    # array without counter, and a counter without array:
+    _split("""
+x[1];REAL;T;1.5
+x[2];REAL;T;-2.5
+num_ys;INT;F;0
+y_label;STR;T;
+"""),
+    # unknown type:
+    _split("""
+component;COMPONENT;F;model
+"""),
+]
+
+
+@pytest.fixture
+def tao():
+    # only the parsers are used, no Tao process:
+    tao = Tao.__new__(Tao)
+    tao.stats = None
+    tao._schemas = {}
+    return tao
+
+
+@pytest.mark.parametrize('data', OUTPUTS)
+def test_parse_dict(tao, data):
+    expected = _convert_arrays(map(_parse_dict_item, data))
+    for _ in range(2):      # with a new and with a cached schema
+        result = tao._parse_dict(data)
+        assert result == expected
+        assert list(result) == list(expected)
+
+
+@pytest.mark.parametrize('data', OUTPUTS)
+def test_parse_param_dict(tao, data):
+    expected = _convert_arrays(map(_parse_param, data))
+    for _ in range(2):
+        result = tao._parse_param_dict(data)
+        assert result == expected
+        assert list(result) == list(expected)
+
+
+def test_parse_invalid(tao):
+    assert tao._parse_dict([['INVALID']]) == OrderedDict()
+    assert tao._parse_param_dict([]) == OrderedDict()
+
+
+def test_parse_error(tao):
+    with pytest.raises(ValueError) as excinfo:
+        tao._parse_dict([['beta_a', 'REAL', 'T', 'abc']])
+    assert 'beta_a' in str(excinfo.value)
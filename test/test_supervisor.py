@@ -0,0 +1,118 @@
+# encoding: utf-8
+"""
+Tests for SupervisedTao. The tests of the command journal don't need Tao.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import signal
+
+import pytest
+
+from pytao.supervisor import Journal, SupervisedTao
+
+
+def journal(*cmds):
+    j = Journal()
+    for cmd in cmds:
+        j.add(cmd)
+    return list(j)
+
+
+def test_skip_read_only():
+    j = Journal()
+    assert not j.add('python lat_ele_list 1@0')
+    assert not j.add('show lattice')
+    assert j.add('use var *')
+    assert list(j) == ['use var *']
+
+
+def test_compact_set():
+    assert journal(
+        'set element q1 k1 = 0.1',
+        'set element q2 k1 = 0.2',
+        'set  element q1 k1 =0.3',
+    ) == [
+        'set element q2 k1 = 0.2',
+        'set  element q1 k1 =0.3',
+    ]
+
+
+def test_compact_absolute_change():
+    assert journal(
+        'change element 1@0>>Q1 k1 @ 0.5',
+        'change element 1@0>>Q2 k1 @ 0.3',
+        'change element 1@0>>Q1 k1 @0.7',
+    ) == [
+        'change element 1@0>>Q2 k1 @ 0.3',
+        'change element 1@0>>Q1 k1 @0.7',
+    ]
+
+
+def test_keep_relative_change():
+    cmds = [
+        'change element 1@0>>Q1 k1 @ 0.5',
+        'change element 1@0>>Q2 k1 @ 0.3',
+        'change element 1@0>>Q3 k1 0.1',
+        'change element 1@0>>Q3 k1 0.1',
+    ]
+    assert journal(*cmds) == cmds
+
+
+def test_keep_other_commands():
+    cmds = ['use var *', 'veto var *', 'use var *']
+    assert journal(*cmds) == cmds
+
+
+def test_keep_order_dependent_commands():
+    cmds = [
+        'change element q1 k1 @ 5.000000000000000e-01',
+        'set global lattice_calc_on = T',
+        'set global lattice_calc_on = F',
+        'set element q1 k1 = 1',
+        'run',
+        'set element q1 k1 = 2',
+    ]
+    assert journal(*cmds) == cmds
+
+
+def test_compact_only_consecutive_overrides():
+    assert journal(
+        'set element q1 k1 = 1',
+        'set element q1 k1 = 2',
+        'run',
+        'set element q1 k1 = 3',
+        'set element q2 k1 = 4',
+        'set element q1 k1 = 5',
+    ) == [
+        'set element q1 k1 = 2',
+        'run',
+        'set element q2 k1 = 4',
+        'set element q1 k1 = 5',
+    ]
+
+
+def test_retry_python_command(fake_tao_available):
+    if not fake_tao_available:
+        pytest.skip("requires the synthetic tao stand-in")
+    tao = SupervisedTao()
+    try:
+        tao.command('fake_lines 3')
+        call = tao._call
+        state = {'killed': False}
+
+        def crash_before_scratch_read(funcname, args, kwargs):
+            if funcname == 'scratch_text' and not state['killed']:
+                state['killed'] = True
+                os.kill(tao._process.pid, signal.SIGKILL)
+                tao._process.wait()
+            return call(funcname, args, kwargs)
+
+        tao._call = crash_before_scratch_read
+        assert len(tao.python('lat_ele_list 1@0')) == 3
+        assert state['killed']
+        assert len(tao.recovery_times) == 1
+    finally:
+        tao.close()
@@ -0,0 +1,119 @@
+# encoding: utf-8
+"""
+Tests for Tao against the synthetic tao stand-in.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import pytest
+
+from pytao.tao import Tao
+
+
+@pytest.fixture
+def cached_tao(fake_tao_available):
+    if not fake_tao_available:
+        pytest.skip("requires the synthetic tao stand-in")
+    tao = Tao(cache_size=16)
+    tao.command('fake_lines 3')
+    yield tao
+    tao.close()
+
+
+def test_scan_invalidates_cache(cached_tao):
+    generation = cached_tao.generation
+    cached_tao.properties('lat_ele1 1@0>>1|model general')
+    cached_tao.scan({'1[k1]': [0.5]}, ['1[k1]'])
+    assert cached_tao.generation > generation
+    assert cached_tao.cache_info().currsize == 0
+
+
+def test_response_matrix_invalidates_cache(cached_tao):
+    generation = cached_tao.generation
+    cached_tao.properties('lat_ele1 1@0>>1|model general')
+    matrix = cached_tao.response_matrix(['1[k1]'], ['1[k1]'])
+    assert cached_tao.generation > generation
+    assert cached_tao.cache_info().currsize == 0
+    # the response columns are still cached:
+    generation = cached_tao.generation
+    assert (cached_tao.response_matrix(['1[k1]'], ['1[k1]']) == matrix).all()
+    assert cached_tao.generation == generation
+
+
+def test_lattice_table(tao):
+    table = tao.lattice_table(['field_2', 'K1'], groups=['general', 'twiss'])
+    assert list(table) == ['field_2', 'k1']
+    assert list(table['field_2']) == [0.75, 1.75, 2.75]
+    assert list(table['k1']) == [0, 0, 0]
+
+
+def test_lattice_table_unknown_name(tao):
+    with pytest.raises(ValueError):
+        tao.lattice_table(['field_1', 'unknown'])
+
+
+def test_batch_status(tao):
+    with tao.batch() as batch:
+        tao.command('fake_lines 2')
+        assert len(tao.python('lat_ele_list 1@0')) == 2
+        tao.command('fake_lines 3')
+    assert batch.status == [0, 0]
+
+
+def test_chdir_sends_batch(tao, tmpdir):
+    cwd = tao.pipe.getcwd()
+    with tao.batch() as batch:
+        tao.command('fake_lines 2')
+        with tao.chdir(str(tmpdir)):
+            assert batch.status == [0]
+            tao.command('fake_lines 3')
+        assert batch.status == [0, 0]
+    assert tao.pipe.getcwd() == cwd
+
+
+def test_get_beam(tao):
+    beam = tao.get_beam('end')
+    assert beam.shape == (8, 3)
+    assert list(beam[0]) == [0, 1e-3, 2e-3]
+
+
+def test_get_beam_missing(tao):
+    with pytest.raises(RuntimeError):
+        tao.get_beam('end', ix_bunch=2)
+    tao.command('fake_lines 0')
+    with pytest.raises(RuntimeError):
+        tao.get_beam('end')
+
+
+def test_stats_bytes(fake_tao_available):
+    if not fake_tao_available:
+        pytest.skip("requires the synthetic tao stand-in")
+    tao = Tao(stats=True)
+    try:
+        tao.command('fake_lines 3')
+        output = tao.capture('show ü')
+        lines = list(tao.capture_iter('show ü'))
+    finally:
+        tao.close()
+    assert lines == output.rstrip('\n').split('\n')
+    stats = tao.stats.verbs['show']
+    assert stats.calls == 2
+    assert stats.lines == 2 * output.count('\n')
+    assert stats.bytes == 2 * len(output.encode('utf-8'))
+    assert stats.phases['capture'].count == 2
+
+
+def test_in_process_init_error(fake_tao_available, monkeypatch):
+    if not fake_tao_available:
+        pytest.skip("requires the synthetic tao stand-in")
+    from pytao import tao_pipe
+
+    def fail(args):
+        raise RuntimeError("init failed")
+    monkeypatch.setattr(tao_pipe, 'set_init_args', fail)
+    with pytest.raises(RuntimeError):
+        Tao(in_process=True)
+    monkeypatch.undo()
+    tao = Tao(in_process=True)
+    tao.close()
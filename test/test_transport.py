@@ -0,0 +1,86 @@
+# encoding: utf-8
+"""
+Tests for the shared memory transport. Only the transfers between
+processes need the synthetic tao stand-in.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import array
+import glob
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from pytao.transport import SHM_DIR, SharedBuffer, export, receive
+
+
+def shm_files():
+    return set(glob.glob(os.path.join(
+        SHM_DIR or tempfile.gettempdir(), 'pytao-*')))
+
+
+@pytest.fixture
+def no_leaks():
+    before = shm_files()
+    yield
+    assert shm_files() == before
+
+
+def test_threshold(no_leaks):
+    text = 'x' * 100
+    assert export(text, None) is text
+    assert export(text, 101) is text
+    assert export(b'', 0) == b''
+    # the threshold applies to the encoded size:
+    shared = export('ü' * 60, 101)
+    assert isinstance(shared, SharedBuffer)
+    assert shared.size == 120
+    assert receive(shared) == 'ü' * 60
+
+
+@pytest.mark.parametrize('data', [
+    'ünïcödé\n' * 100,
+    b'\0\1\2' * 100,
+    array.array(str('d'), np.linspace(0, 1, 100)),
+    array.array(str('i'), range(100)),
+    np.arange(100, dtype=np.float64),
+])
+def test_round_trip(no_leaks, data):
+    shared = export(data, 1)
+    assert isinstance(shared, SharedBuffer)
+    assert os.path.exists(shared.path)
+    loaded = receive(shared)
+    assert not os.path.exists(shared.path)
+    if isinstance(data, (bytes, type(''))):
+        assert loaded[:] == data
+    else:
+        assert list(loaded) == list(data)
+
+
+def test_receive_plain_data():
+    data = [1, 2]
+    assert receive(data) is data
+
+
+def test_transfer_from_tao(fake_tao_available, no_leaks):
+    if not fake_tao_available:
+        pytest.skip("requires the synthetic tao stand-in")
+    from pytao.tao import Tao
+    taos = [Tao(shm_threshold=None), Tao(shm_threshold=1)]
+    try:
+        for tao in taos:
+            tao.command('fake_lines 200')
+        rows, shared_rows = [
+            tao.python('lat_ele_list 1@0') for tao in taos]
+        table, shared_table = [
+            tao.lattice_table(['field_1']) for tao in taos]
+    finally:
+        for tao in taos:
+            tao.close()
+    assert shared_rows == rows
+    assert len(rows) == 200
+    np.testing.assert_array_equal(shared_table['field_1'], table['field_1'])
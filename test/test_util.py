@@ -0,0 +1,71 @@
+# encoding: utf-8
+"""
+Tests for the vectorized coordinate transformations, which must agree with
+the scalar versions.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import numpy as np
+import pytest
+
+from pytao import util
+
+
+M = 0.51099895e6        # electron mass [eV]
+E0 = 1.2e9              # total energy [eV]
+P0C = np.sqrt(E0**2 - M**2)
+TWISS = dict(beta=P0C/E0, e_tot=E0, p0c=P0C)
+
+
+@pytest.fixture
+def coords():
+    rng = np.random.RandomState(0)
+    return rng.normal(scale=1e-3, size=(6, 50))
+
+
+def test_t_to_z_array(coords):
+    t, pt = coords[4], coords[5]
+    z, pz = util.t_to_z_array(t, pt, M, E0)
+    expected = np.array([util.t_to_z(*args, M=M, E0=E0)
+                         for args in zip(t, pt)]).T
+    np.testing.assert_allclose([z, pz], expected, rtol=1e-12, atol=1e-15)
+
+
+def test_z_to_t_array(coords):
+    z, pz = coords[4], coords[5]
+    t, pt = util.z_to_t_array(z, pz, **TWISS)
+    expected = np.array([util.z_to_t(*args, **TWISS)
+                         for args in zip(z, pz)]).T
+    np.testing.assert_allclose([t, pt], expected, rtol=1e-12, atol=1e-15)
+
+
+def test_scalar_input():
+    z, pz = util.t_to_z_array(1e-3, 2e-4, M, E0)
+    assert np.allclose((z, pz), util.t_to_z(1e-3, 2e-4, M, E0))
+    t, pt = util.z_to_t_array(1e-3, 2e-4, **TWISS)
+    assert np.allclose((t, pt), util.z_to_t(1e-3, 2e-4, **TWISS))
+
+
+def test_phase_space(coords):
+    bmad = util.madx_to_bmad(coords, M, E0)
+    np.testing.assert_array_equal(bmad[:4], coords[:4])
+    np.testing.assert_allclose(
+        bmad[4:], util.t_to_z_array(coords[4], coords[5], M, E0))
+    madx = util.bmad_to_madx(coords, **TWISS)
+    np.testing.assert_array_equal(madx[:4], coords[:4])
+    np.testing.assert_allclose(
+        madx[4:], util.z_to_t_array(coords[4], coords[5], **TWISS))
+
+
+def test_in_place(coords):
+    expected = util.madx_to_bmad(coords, M, E0)
+    result = util.madx_to_bmad(coords, M, E0, out=coords)
+    assert result is coords
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_phase_space_shape():
+    with pytest.raises(ValueError):
+        util.madx_to_bmad(np.zeros((4, 3)), M, E0)
@@ -0,0 +1,85 @@
+# encoding: utf-8
+"""
+Tests for the binary protocol of pytao.wire. The codecs don't need Tao.
+"""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import array
+
+import pytest
+
+from pytao import wire
+
+
+TEXTS = ['', 'show lattice', 'ünïcödé', 'a;b\nc']
+
+LISTS = [[], [''], ['', ''], ['set global lattice_calc_on = F', ''],
+         TEXTS]
+
+ARGS = {
+    'command': TEXTS,
+    'commands': LISTS,
+    'capture': TEXTS,
+    'scratch_text': [None],
+    'scratch_array': [None],
+}
+
+RESULTS = {
+    'command': [0, 1, -1],
+    'commands': [[], [0], [0, 1, -1]],
+    'capture': TEXTS,
+    'scratch_text': TEXTS,
+    'scratch_array': [(0, array.array(str('d'))),
+                      (2, array.array(str('d'), [1.5, -2, 0, 1e300]))],
+}
+
+
+@pytest.mark.parametrize('name', sorted(wire.CODECS))
+def test_args_round_trip(name):
+    encode_args, decode_args, _, _ = wire.CODECS[name]
+    for args in ARGS[name]:
+        decoded = decode_args(encode_args(args))
+        assert decoded == (() if args is None else (args,))
+
+
+@pytest.mark.parametrize('name', sorted(wire.CODECS))
+def test_result_round_trip(name):
+    _, _, encode_result, _ = wire.CODECS[name]
+    for result in RESULTS[name]:
+        decoded = wire.decode_reply(name, wire.OK, encode_result(result))
+        if name == 'scratch_array':
+            ncols, data = decoded
+            decoded = (ncols, array.array(str('d'), bytes(data)))
+        assert decoded == result
+
+
+def test_decode_error():
+    payload = wire._encode_text('ValueError: invalid')
+    with pytest.raises(ValueError) as excinfo:
+        wire.decode_reply('command', wire.ERROR, payload)
+    assert str(excinfo.value) == 'invalid'
+
+
+def test_split_frames():
+    frames = [wire.encode_request('commands', cmds) for cmds in LISTS]
+    buffer = bytearray(b''.join(frames) + frames[0][:3])
+    split = wire.split_frames(buffer)
+    assert [opcode for opcode, _ in split] == [wire.OPCODES['commands']] * 5
+    assert [wire._decode_list(payload) for _, payload in split] == LISTS
+    assert buffer == frames[0][:3]
+
+
+def test_command_many_empty_commands(fake_tao_available):
+    if not fake_tao_available:
+        pytest.skip("requires the synthetic tao stand-in")
+    from pytao.tao import Tao
+    for protocol in ('pickle', 'binary'):
+        tao = Tao(protocol=protocol)
+        try:
+            assert tao.command_many([]) == []
+            assert tao.command_many(['']) == [0]
+            assert tao.command_many(['', '']) == [0, 0]
+        finally:
+            tao.close()